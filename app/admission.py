@@ -0,0 +1,250 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Optional
+
+import orjson
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+from app.metrics import Counter, Gauge, Histogram
+
+# Per-worker admission control. Each route class has a concurrency limit;
+# requests over it wait in a bounded queue and are shed with a fast 503
+# when the queue is full or they would not start before the queue
+# deadline. Without it, bursts queue inside the worker until the database
+# pool checkout times out and clients get slow 500s.
+#
+# Limits adapt to observed latency, AIMD style: a request that took much
+# longer than the best recent latency, or failed with a 5xx other than a
+# 503, cuts the limit by a ratio (at most once per latency period).
+# Requests that complete in time while the limit is in use raise it by
+# about one per period. The best latency slowly decays so it follows the
+# deployment as it changes. Media uploads have a small fixed limit instead:
+# their latency follows file size and client bandwidth, not server load
+
+# Long-lived or bandwidth-bound requests would hold slots and skew latency
+EXEMPT_PREFIXES = (
+    "/health/",
+    "/metrics",
+    "/admin/",
+    "/realtime/",
+    get_settings().media_base_url,
+)
+MEDIA_PREFIX = "/media/"
+
+# Weight of a new sample in the smoothed latency, and how fast the best
+# latency is allowed to rise per completed request
+SMOOTHING = 0.1
+BASELINE_DECAY = 1.001
+
+admission_waits = Histogram(
+    "admission_queue_wait_seconds",
+    "Time admitted requests waited for a slot, by route class",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+admission_rejections = Counter(
+    "admission_rejections_total",
+    "Requests shed with a 503, by route class and reason "
+    "(queue_full, deadline, timeout)",
+)
+
+
+def route_class(scope: Scope) -> Optional[str]:
+    path = scope["path"]
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path.startswith(MEDIA_PREFIX):
+        return "media"
+    if scope["method"] in ("GET", "HEAD", "OPTIONS"):
+        return "read"
+    if path.startswith("/auth/"):
+        return "auth"
+    return "write"
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, initial_limit: int, adaptive: bool = True):
+        settings = get_settings()
+        self.name = name
+        self.adaptive = adaptive
+        self.min_limit = settings.admission_min_limit
+        self.max_limit = settings.admission_max_limit
+        self.limit = float(
+            min(max(initial_limit, self.min_limit), self.max_limit)
+            if adaptive
+            else initial_limit
+        )
+        self.queue_size = settings.admission_queue_size
+        self.queue_timeout = settings.admission_queue_timeout_ms / 1000
+        self.in_flight = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.baseline_latency: Optional[float] = None
+        self.smoothed_latency: Optional[float] = None
+        self._last_decrease = 0.0
+
+    def expected_wait(self):
+        # Time until a new waiter would get a slot, if slots free up at the
+        # current smoothed latency
+        if self.smoothed_latency is None:
+            return 0
+        return (len(self.waiters) + 1) * self.smoothed_latency / self.limit
+
+    async def acquire(self) -> Optional[str]:
+        # None once a slot is held, otherwise the reason to shed
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+        if self.expected_wait() > self.queue_timeout:
+            return "deadline"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if waiter.done():
+            return None
+        self._abandon(waiter)
+        return "timeout"
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done():
+            # Granted while giving up: pass the slot on
+            self.in_flight -= 1
+            self._wake()
+            return
+        waiter.cancel()
+        self.waiters.remove(waiter)
+
+    def _wake(self):
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def release(self, latency: float, failed: bool):
+        in_use = self.in_flight >= self.limit / 2
+        self.in_flight -= 1
+        if self.adaptive:
+            self._adapt(latency, failed, in_use)
+        self._wake()
+
+    def _adapt(self, latency: float, failed: bool, in_use: bool):
+        settings = get_settings()
+        if self.baseline_latency is None or self.smoothed_latency is None:
+            self.baseline_latency = self.smoothed_latency = latency
+        self.baseline_latency = min(self.baseline_latency * BASELINE_DECAY, latency)
+        self.smoothed_latency += SMOOTHING * (latency - self.smoothed_latency)
+
+        now = time.monotonic()
+        overloaded = failed or (
+            latency
+            > self.baseline_latency * settings.admission_latency_tolerance
+            + settings.admission_latency_floor_ms / 1000
+        )
+        if overloaded:
+            # Requests admitted before a cut complete slowly too; one cut
+            # per period keeps them from collapsing the limit
+            if now - self._last_decrease >= self.smoothed_latency:
+                self.limit = max(
+                    self.min_limit, self.limit * settings.admission_backoff_ratio
+                )
+                self._last_decrease = now
+        elif in_use:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+limiters = {
+    name: AdaptiveLimiter(name, limit)
+    for name, limit in get_settings().admission_limits.items()
+}
+limiters["media"] = AdaptiveLimiter(
+    "media", get_settings().admission_media_limit, adaptive=False
+)
+
+admission_limit = Gauge(
+    "admission_limit",
+    "Current adaptive concurrency limit, by route class",
+    lambda: {
+        (("route_class", name),): limiter.limit for name, limiter in limiters.items()
+    },
+)
+admission_in_flight = Gauge(
+    "admission_in_flight",
+    "Admitted requests in progress, by route class",
+    lambda: {
+        (("route_class", name),): limiter.in_flight
+        for name, limiter in limiters.items()
+    },
+)
+admission_queued = Gauge(
+    "admission_queued",
+    "Requests waiting for a slot, by route class",
+    lambda: {
+        (("route_class", name),): len(limiter.waiters)
+        for name, limiter in limiters.items()
+    },
+)
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limiter = limiters.get(route_class(scope))
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        queued = time.perf_counter()
+        reason = await limiter.acquire()
+        if reason is not None:
+            admission_rejections.inc(route_class=limiter.name, reason=reason)
+            return await self.reject(send, limiter)
+
+        started = time.perf_counter()
+        admission_waits.observe(started - queued, route_class=limiter.name)
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # A 503 means a backend is down, which fewer concurrent requests
+            # would not fix
+            limiter.release(
+                time.perf_counter() - started, status >= 500 and status != 503
+            )
+
+    async def reject(self, send: Send, limiter: AdaptiveLimiter):
+        retry_after = max(1, math.ceil(limiter.expected_wait()))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(retry_after).encode()),
+                ],
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": orjson.dumps({"detail": "Server is overloaded"}),
+            }
+        )
@@ -1,11 +1,183 @@
-from typing import Annotated
+from typing import Annotated, Optional
 
 import redis
+import redis.asyncio
+import redis.asyncio.cluster
+import redis.client
+import redis.cluster
 from fastapi import Depends
+from redis.backoff import NoBackoff
+from redis.retry import Retry
 
 from app.config import get_settings
+from app.resilience import CircuitBreaker, CircuitOpenError, retry
 
-r = redis.from_url(url=get_settings().redis_url)
+# Every command goes through one breaker per Redis deployment, with a socket
+# deadline instead of redis-py's default retry policy (which can stall a
+# request for many seconds). Only reads are retried.
+#
+# With REDIS_CLUSTER the same guards wrap the cluster clients. Keys used
+# together by one pipeline or script share a hash tag (the part in braces),
+# which maps them to one slot, see app/token.py
+READ_COMMANDS = frozenset(
+    {
+        "GET",
+        "MGET",
+        "EXISTS",
+        "TTL",
+        "PTTL",
+        "HGET",
+        "HGETALL",
+        "SISMEMBER",
+        "SMEMBERS",
+        "SCARD",
+        "XLEN",
+        "XRANGE",
+        "XREVRANGE",
+    }
+)
+
+
+class RedisCircuitOpenError(CircuitOpenError):
+    pass
+
+
+redis_breaker = CircuitBreaker("redis", error=RedisCircuitOpenError)
+
+
+def is_redis_unavailable(e: BaseException):
+    return isinstance(
+        e, (RedisCircuitOpenError, redis.ConnectionError, redis.TimeoutError)
+    )
+
+
+class GuardedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        with redis_breaker.guard(is_redis_unavailable):
+            return super().execute(raise_on_error)
+
+
+def guard_pipeline(pipe):
+    # ClusterPipeline's constructor changes between redis-py releases, so
+    # its execute is wrapped rather than subclassed
+    execute = pipe.execute
+
+    def guarded_execute(*args, **kwargs):
+        with redis_breaker.guard(is_redis_unavailable):
+            return execute(*args, **kwargs)
+
+    pipe.execute = guarded_execute
+    return pipe
+
+
+class GuardedCommands:
+    def execute_command(self, *args, **options):
+        execute = super().execute_command
+        attempts = (
+            get_settings().redis_sync_read_attempts if args[0] in READ_COMMANDS else 1
+        )
+        for attempt in range(attempts):
+            try:
+                with redis_breaker.guard(is_redis_unavailable):
+                    return execute(*args, **options)
+            except redis.RedisError as e:
+                # The sync client runs on the event loop, so retries reconnect
+                # right away instead of sleeping
+                if attempt + 1 >= attempts or not is_redis_unavailable(e):
+                    raise
+
+
+class GuardedRedis(GuardedCommands, redis.Redis):
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None):
+        return GuardedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+class GuardedRedisCluster(GuardedCommands, redis.cluster.RedisCluster):
+    def pipeline(self, transaction=None, shard_hint=None):
+        return guard_pipeline(super().pipeline(transaction, shard_hint))
+
+
+def guard_async_pipeline(pipe):
+    execute = pipe.execute
+
+    async def guarded_execute(*args, **kwargs):
+        with redis_breaker.guard(is_redis_unavailable):
+            return await execute(*args, **kwargs)
+
+    pipe.execute = guarded_execute
+    return pipe
+
+
+class GuardedAsyncCommands:
+    async def execute_command(self, *args, **options):
+        execute = super().execute_command
+
+        async def call():
+            with redis_breaker.guard(is_redis_unavailable):
+                return await execute(*args, **options)
+
+        if args[0] not in READ_COMMANDS:
+            return await call()
+        return await retry(call, is_redis_unavailable)
+
+
+class GuardedAsyncRedis(GuardedAsyncCommands, redis.asyncio.Redis):
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None):
+        return guard_async_pipeline(super().pipeline(transaction, shard_hint))
+
+
+class GuardedAsyncRedisCluster(
+    GuardedAsyncCommands, redis.asyncio.cluster.RedisCluster
+):
+    def pipeline(self, transaction=None, shard_hint=None):
+        return guard_async_pipeline(super().pipeline(transaction, shard_hint))
+
+
+def client_options(sync: bool = False):
+    settings = get_settings()
+    options = {
+        "socket_timeout": settings.redis_socket_timeout_seconds,
+        "socket_connect_timeout": settings.redis_connect_timeout_seconds,
+    }
+    if sync:
+        # Called from async handlers, where every wait stalls the loop
+        options["socket_timeout"] = settings.redis_sync_timeout_seconds
+        options["socket_connect_timeout"] = settings.redis_sync_timeout_seconds
+    # Cluster clients keep redis-py's retries, which are what follows
+    # MOVED/ASK redirections and failovers
+    if not settings.redis_cluster:
+        options["retry"] = Retry(NoBackoff(), 0)
+    return options
+
+
+def async_client_class():
+    # Cluster-aware when REDIS_CLUSTER is set, for clients built elsewhere
+    # (the job worker) on the same deployment
+    if get_settings().redis_cluster:
+        return redis.asyncio.cluster.RedisCluster
+    return redis.asyncio.Redis
+
+
+if get_settings().redis_cluster:
+    r = GuardedRedisCluster.from_url(
+        get_settings().redis_url, **client_options(sync=True)
+    )
+    async_r = GuardedAsyncRedisCluster.from_url(
+        get_settings().redis_url, **client_options()
+    )
+else:
+    r = GuardedRedis.from_url(get_settings().redis_url, **client_options(sync=True))
+    async_r = GuardedAsyncRedis.from_url(get_settings().redis_url, **client_options())
+
+# Long-lived subscriptions block on reads by design, so they get their own
+# client without a socket deadline or breaker. On a cluster this is a plain
+# connection to the configured node: PUBLISH reaches subscribers on any node
+pubsub_r = redis.asyncio.from_url(
+    get_settings().redis_url,
+    socket_connect_timeout=get_settings().redis_connect_timeout_seconds,
+)
 
 
 def get_redis():
@@ -14,6 +186,13 @@ def get_redis():
 
 RedisDep = Annotated[redis.Redis, Depends(get_redis)]
 
+
+def get_async_redis():
+    yield async_r
+
+
+AsyncRedisDep = Annotated[redis.asyncio.Redis, Depends(get_async_redis)]
+
 # pipe = r.pipeline()
 
 
@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import csv
+import itertools
+import sys
+import time
+from typing import Optional
+
+import anyio
+from sqlalchemy import event, text
+
+from app.cache import async_r
+from app.config import get_settings
+from app.database import async_session, engine
+from app.internal.bulk import export_users, import_users, validate_rows
+from app.internal.purge import purge_deleted_users
+from app.internal.stats import reconcile_all_user_stats
+from app.profiling import sign_profile_token
+from app.token import migrate_refresh_tokens
+
+# Usage:
+#   python -m app.cli import-users users.csv [--rejects rejects.csv]
+#   python -m app.cli export-users [users.csv]
+#   python -m app.cli reconcile-stats
+#   python -m app.cli purge-users
+#   python -m app.cli migrate-user-indexes
+#   python -m app.cli migrate-token-keys
+#   python -m app.cli profile-token [--ttl 300]
+
+# Replaces the full unique indexes on users with the partial ones declared in
+# app/models.py without blocking writes. CONCURRENTLY cannot run inside a
+# transaction, hence one autocommit statement each
+USER_INDEX_MIGRATION = (
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_live "
+    "ON users (email) WHERE status <> 'deleted'",
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_live "
+    "ON users (username) WHERE status <> 'deleted'",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_deleted_updated_at "
+    "ON users (updated_at) WHERE status = 'deleted'",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_users_email",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_users_username",
+)
+
+
+async def run_import_users(path: str, rejects_path: Optional[str]):
+    imported = 0
+    rejected = 0
+    batch_size = get_settings().bulk_batch_size
+
+    with open(path, newline="", encoding="utf-8") as file:
+        rejects_file = (
+            open(rejects_path, "w", newline="", encoding="utf-8")
+            if rejects_path
+            else sys.stderr
+        )
+        rejects_writer = csv.DictWriter(rejects_file, ["line", "email", "error"])
+        rejects_writer.writeheader()
+
+        # Line 1 is the header
+        rows = enumerate(csv.DictReader(file), start=2)
+        while batch := list(itertools.islice(rows, batch_size)):
+            records, rejects = validate_rows(batch)
+            if records:
+                async with async_session() as db:
+                    count, conflicts = await import_users(db, records)
+                imported += count
+                rejects += conflicts
+
+            rejects_writer.writerows(sorted(rejects, key=lambda reject: reject["line"]))
+            rejected += len(rejects)
+
+        if rejects_file is not sys.stderr:
+            rejects_file.close()
+
+    print(f"Imported {imported} users, rejected {rejected}", file=sys.stderr)
+
+
+async def run_export_users(path: Optional[str]):
+    if path:
+        async with await anyio.open_file(path, "wb") as file:
+            async with async_session() as db:
+                await export_users(db, file.write)
+    else:
+        stdout = anyio.wrap_file(sys.stdout.buffer)
+        async with async_session() as db:
+            await export_users(db, stdout.write)
+        await stdout.flush()
+
+
+async def run_migrate_user_indexes():
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        for statement in USER_INDEX_MIGRATION:
+            print(statement, file=sys.stderr)
+            await connection.execute(text(statement))
+
+
+async def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import-users")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--rejects")
+
+    export_parser = commands.add_parser("export-users")
+    export_parser.add_argument("path", nargs="?")
+
+    commands.add_parser("reconcile-stats")
+    commands.add_parser("purge-users")
+    commands.add_parser("migrate-user-indexes")
+    commands.add_parser("migrate-token-keys")
+
+    profile_token_parser = commands.add_parser("profile-token")
+    profile_token_parser.add_argument("--ttl", type=int, default=300)
+
+    args = parser.parse_args()
+
+    if args.command == "profile-token":
+        if not get_settings().profiling_secret:
+            parser.error("PROFILING_SECRET is not set")
+        # Value for the X-Profile header
+        print(sign_profile_token(int(time.time()) + args.ttl))
+        return
+
+    if args.command == "migrate-token-keys":
+        # Safe to run while the app serves, and to run again
+        try:
+            migrated = await migrate_refresh_tokens(async_r)
+            print(f"Migrated {migrated} refresh tokens", file=sys.stderr)
+        finally:
+            await async_r.aclose()
+        return
+
+    # SQL echo would interleave with exported data
+    engine.echo = False
+
+    # Batch jobs outlast the per-statement deadline meant for requests
+    @event.listens_for(engine.sync_engine, "do_connect", insert=True)
+    def disable_command_timeout(dialect, connection_record, cargs, cparams):
+        cparams["command_timeout"] = None
+
+    try:
+        if args.command == "import-users":
+            await run_import_users(args.path, args.rejects)
+        elif args.command == "export-users":
+            await run_export_users(args.path)
+        elif args.command == "reconcile-stats":
+            fixed = await reconcile_all_user_stats()
+            print(f"Reconciled user stats, {fixed} rows fixed", file=sys.stderr)
+        elif args.command == "purge-users":
+            purged = await purge_deleted_users()
+            print(f"Purged {purged} deleted users", file=sys.stderr)
+        elif args.command == "migrate-user-indexes":
+            await run_migrate_user_indexes()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
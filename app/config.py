@@ -6,16 +6,33 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     environment: str = "development"
-    
+
     # PostgreSQL
     database_url_async: str = ""
+    # JSON list, e.g. '["postgresql+asyncpg://..."]'
+    database_read_urls_async: list[str] = []
+    replica_max_lag_seconds: float = 5
+    replica_health_check_interval_seconds: float = 5
+    read_your_writes_seconds: int = 10
+    bulk_batch_size: int = 5000
 
     # Redis
     redis_url: str = ""
+    # With REDIS_CLUSTER, REDIS_URL names any node; slots are discovered from it
+    redis_cluster: bool = False
 
     # JWT
     jwt_algorithm: str = ""
     jwt_secret_key: str = ""
+    # Asymmetric algorithms (EdDSA, ES256): PEM private key used to sign, its
+    # key id, and PEM public keys by key id that are still accepted (rotation)
+    jwt_private_key: str = ""
+    jwt_key_id: str = ""
+    jwt_verification_keys: dict[str, str] = {}
+    # HMAC algorithm JWT_SECRET_KEY signed with before the switch; tokens
+    # without a key id are verified with it
+    jwt_legacy_algorithm: str = "HS256"
+    jwks_max_age_seconds: int = 300
 
     # Email (Resend)
     resend_api_key: str = ""
@@ -25,6 +42,111 @@ class Settings(BaseSettings):
     access_token_expiry_minutes: int = 15
     refresh_token_expiry_days: int = 30
 
+    # Follows
+    follow_page_size: int = 50
+    follow_cache_hot_threshold: int = 100
+    follow_cache_ttl_seconds: int = 60 * 60
+
+    # Profile counters
+    stats_reconcile_interval_seconds: int = 60 * 60
+    stats_reconcile_batch_size: int = 1000
+
+    # Deleted users are purged after a grace period, a few users at a time,
+    # their rows in batches of user_purge_batch_size per transaction
+    user_purge_grace_days: int = 30
+    user_purge_interval_seconds: int = 60 * 60
+    user_purge_users_per_batch: int = 50
+    user_purge_batch_size: int = 1000
+
+    # Request coalescing
+    singleflight_redis_enabled: bool = False
+    singleflight_redis_lock_ms: int = 200
+
+    # Resilience
+    redis_socket_timeout_seconds: float = 1
+    redis_connect_timeout_seconds: float = 1
+    # The sync client blocks the event loop while it waits, so it gets a
+    # shorter deadline and at most this many attempts per read
+    redis_sync_timeout_seconds: float = 0.25
+    redis_sync_read_attempts: int = 2
+    database_connect_timeout_seconds: float = 3
+    database_command_timeout_seconds: float = 5
+    database_pool_timeout_seconds: float = 5
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout_seconds: float = 10
+    retry_attempts: int = 3
+    retry_base_delay_seconds: float = 0.05
+    stale_cache_size: int = 10000
+
+    # Jobs: concurrency per queue, used by `python -m app.worker`
+    job_queues: dict[str, int] = {"default": 8, "email": 4}
+    job_max_attempts: int = 5
+    job_retry_base_delay_seconds: float = 5
+    job_timeout_seconds: float = 60
+    job_visibility_timeout_seconds: int = 300
+    job_dedupe_ttl_seconds: int = 24 * 60 * 60
+    job_stream_max_length: int = 100000
+    job_block_ms: int = 5000
+    job_maintenance_interval_seconds: float = 1
+
+    # Warm-up before serving. Connections beyond the pool size (5) would be
+    # closed again on release
+    warmup_enabled: bool = True
+    warmup_db_connections: int = 5
+    warmup_redis_connections: int = 5
+    warmup_timeout_seconds: float = 30
+
+    # Event loop health
+    loop_monitor_enabled: bool = True
+    loop_monitor_interval_ms: int = 100
+    loop_block_threshold_ms: int = 100
+
+    # Profiling: disabled unless a secret is set
+    profiling_secret: str = ""
+    profiling_interval_ms: int = 5
+    profiling_max_seconds: int = 60
+    profiling_result_ttl_seconds: int = 60 * 60
+
+    # HTTP caching
+    response_cache_size: int = 10000
+
+    # Admission control, per worker: initial concurrency limit by route class
+    # (see app/admission.py), bounds for the adaptive limits, and the wait
+    # queue. A request is slow when it takes over tolerance times the best
+    # recent latency plus the floor. Media uploads have a fixed limit
+    admission_enabled: bool = True
+    admission_limits: dict[str, int] = {"auth": 16, "write": 32, "read": 64}
+    admission_media_limit: int = 4
+    admission_min_limit: int = 4
+    admission_max_limit: int = 256
+    admission_queue_size: int = 128
+    admission_queue_timeout_ms: int = 1000
+    admission_latency_tolerance: float = 2
+    admission_latency_floor_ms: int = 50
+    admission_backoff_ratio: float = 0.9
+
+    # Idempotency keys: how long responses are replayed, and how long a
+    # claimed key waits for its request before duplicates get a 409
+    idempotency_ttl_seconds: int = 600
+    idempotency_lock_ms: int = 10000
+
+    # Realtime
+    realtime_max_connections: int = 10000
+    realtime_queue_size: int = 64
+    realtime_send_timeout_seconds: float = 5
+    realtime_keepalive_seconds: int = 15
+
+    # Media
+    media_storage_backend: str = "local"
+    media_storage_root: str = "media"
+    media_base_url: str = "/media/files"
+    media_chunk_size: int = 1024 * 1024
+    media_max_bytes: int = 50 * 1024 * 1024
+    media_max_files: int = 10
+    media_thumbnail_size: int = 320
+    media_profile_picture_size: int = 512
+    media_process_workers: int = 2
+
     model_config = SettingsConfigDict(
         env_file=(".env"),
         env_file_encoding="utf-8",
@@ -1,22 +1,93 @@
+import asyncio
+import logging
 import uuid
-from typing import Annotated
+from typing import Annotated, Optional
 
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import jwt
+from fastapi import Depends, Request
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import ExceptionContext
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 
+from app.cache import async_r, is_redis_unavailable
 from app.config import get_settings
 from app.models import Base
+from app.resilience import OPEN, CircuitBreaker, CircuitOpenError
+from app.token import get_user_id_from_access_token
 
 connect_args = {
     "server_settings": {"jit": "off"},
     "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+    "timeout": get_settings().database_connect_timeout_seconds,
+    "command_timeout": get_settings().database_command_timeout_seconds,
 }
 
-engine = create_async_engine(
-    get_settings().database_url_async,
-    echo=True,
-    connect_args=connect_args,
-)
+
+def create_engine(url: str):
+    return create_async_engine(
+        url,
+        echo=True,
+        pool_timeout=get_settings().database_pool_timeout_seconds,
+        connect_args=connect_args,
+    )
+
+
+class DatabaseCircuitOpenError(CircuitOpenError):
+    pass
+
+
+def is_database_unavailable(e: BaseException):
+    # Connection loss, deadlines and an exhausted pool, as opposed to errors
+    # caused by the statement itself
+    return isinstance(
+        e,
+        (
+            DatabaseCircuitOpenError,
+            TimeoutError,
+            OSError,
+            exc.TimeoutError,
+            exc.OperationalError,
+            exc.InterfaceError,
+        ),
+    ) or (isinstance(e, exc.DBAPIError) and e.connection_invalidated)
+
+
+def guard_engine(engine: AsyncEngine, breaker: CircuitBreaker):
+    # Checked before connecting and before each statement, so an open breaker
+    # fails fast without waiting on a dead server or holding pool slots
+    def connect(dialect, connection_record, cargs, cparams):
+        # Connection errors never reach handle_error, so connect here
+        with breaker.guard(is_database_unavailable):
+            return dialect.connect(*cargs, **cparams)
+
+    def before_cursor_execute(*args, **kwargs):
+        breaker.before_call()
+
+    def after_cursor_execute(*args, **kwargs):
+        breaker.record_success()
+
+    def handle_error(context: ExceptionContext):
+        # DBAPI errors are judged by their SQLAlchemy wrapper
+        error = context.sqlalchemy_exception or context.original_exception
+        if isinstance(error, CircuitOpenError):
+            return
+        if context.is_disconnect or is_database_unavailable(error):
+            breaker.record_failure()
+
+    event.listen(engine.sync_engine, "do_connect", connect)
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", handle_error)
+
+
+engine = create_engine(get_settings().database_url_async)
+database_breaker = CircuitBreaker("postgres", error=DatabaseCircuitOpenError)
+guard_engine(engine, database_breaker)
 
 async_session = async_sessionmaker(
     engine,
@@ -36,3 +107,140 @@ async def get_session():
 
 
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
+
+
+# Read replicas
+REPLICA_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class Replica:
+    def __init__(self, engine: AsyncEngine, name: str):
+        self.engine = engine
+        self.breaker = CircuitBreaker(name, error=DatabaseCircuitOpenError)
+        self.healthy = False
+        self.lag: Optional[float] = None
+        guard_engine(engine, self.breaker)
+
+
+class ReplicaSet:
+    # Replicas are only used once a health check has seen them within the
+    # allowed lag; when none qualify, reads fall back to the primary
+
+    def __init__(self, engines: list[AsyncEngine]):
+        self.replicas = [
+            Replica(engine, f"postgres_replica_{i}") for i, engine in enumerate(engines)
+        ]
+        self._next = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def choose(self):
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            if replica.healthy and replica.breaker.state != OPEN:
+                return replica
+        return None
+
+    async def check(self, replica: Replica):
+        try:
+            async with replica.engine.connect() as connection:
+                replica.lag = float(await connection.scalar(REPLICA_LAG_QUERY))
+            replica.healthy = replica.lag <= get_settings().replica_max_lag_seconds
+        except Exception as e:
+            if replica.healthy:
+                logging.error(f"Read replica failed health check: {str(e)}")
+            replica.healthy = False
+            replica.lag = None
+
+    async def _run(self):
+        while True:
+            await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+            await asyncio.sleep(get_settings().replica_health_check_interval_seconds)
+
+    def start(self):
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+replicas = ReplicaSet(
+    [create_engine(url) for url in get_settings().database_read_urls_async]
+)
+
+
+def recent_write_key(user_id: str):
+    return f"recent_write:{user_id}"
+
+
+async def mark_recent_write(user_id: str):
+    # Pins the user's reads to the primary for a short window so they see
+    # their own writes even if replicas lag behind. Kept in Redis by user
+    # rather than in a cookie, so bearer-token clients are pinned too
+    try:
+        await async_r.set(
+            recent_write_key(user_id), 1, ex=get_settings().read_your_writes_seconds
+        )
+    except Exception as e:
+        if not is_redis_unavailable(e):
+            raise
+        logging.error(f"Failed to mark recent write: {str(e)}")
+
+
+async def is_pinned_to_primary(request: Request):
+    # Looked up once per request: the read session dependency and the
+    # handler both ask
+    pinned = getattr(request.state, "pinned_to_primary", None)
+    if pinned is None:
+        pinned = request.state.pinned_to_primary = await lookup_primary_pin(request)
+    return pinned
+
+
+async def lookup_primary_pin(request: Request):
+    if not replicas.replicas:
+        return True
+
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        user_id = get_user_id_from_access_token(authorization[7:])
+    except jwt.InvalidTokenError:
+        return False
+
+    try:
+        return bool(await async_r.exists(recent_write_key(user_id)))
+    except Exception as e:
+        # Without the marker the primary is the safe choice
+        if not is_redis_unavailable(e):
+            raise
+        return True
+
+
+def read_session(primary: bool = False):
+    replica = None if primary else replicas.choose()
+    if replica is None:
+        return async_session()
+    return async_session(bind=replica.engine)
+
+
+async def get_read_session(request: Request):
+    async with read_session(await is_pinned_to_primary(request)) as session:
+        yield session
+
+
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
@@ -8,15 +8,21 @@ from fastapi import (
 )
 from fastapi.security import OAuth2PasswordBearer
 
-from app.database import SessionDep
-from app.internal.users import get_user
+from app.cache import is_redis_unavailable
+from app.database import ReadSessionDep, is_database_unavailable
+from app.internal.users import load_current_user
+from app.resilience import service_unavailable
 from app.token import get_user_id_from_access_token
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+def is_backend_unavailable(e: BaseException):
+    return is_database_unavailable(e) or is_redis_unavailable(e)
+
+
 async def read_current_user(
-    db: SessionDep,
+    db: ReadSessionDep,
     token: Annotated[str, Depends(oauth2_scheme)],
 ):
     credentials_exception = HTTPException(
@@ -31,11 +37,12 @@ async def read_current_user(
     except jwt.InvalidTokenError:
         raise credentials_exception
 
-    user = await get_user(
-        db,
-        id=user_id,
-    )
-    if not user:
+    try:
+        user = await load_current_user(db, user_id)
+    except Exception as e:
+        # An outage must not look like a bad token, or clients log users out
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
         raise credentials_exception
 
     return user
@@ -0,0 +1,86 @@
+import datetime
+import hashlib
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Hashable
+
+import orjson
+from fastapi import Request, Response, status
+
+from app.config import get_settings
+
+
+class ResponseCache:
+    # Per-worker LRU of serialized response bodies. Keys embed the row
+    # version (updated_at), so stale entries are never served, only evicted
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, bytes] = OrderedDict()
+
+    def get(self, key: Hashable):
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def set(self, key: Hashable, body: bytes):
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+response_cache = ResponseCache(get_settings().response_cache_size)
+
+
+def make_etag(key: Hashable):
+    return f'"{hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()}"'
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime.datetime):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return any(
+            tag.strip().removeprefix("W/") in (etag, "*")
+            for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+
+    return False
+
+
+def cached_json_response(
+    request: Request,
+    key: Hashable,
+    last_modified: datetime.datetime,
+    build: Callable[[], object],
+):
+    etag = make_etag(key)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(
+            last_modified.astimezone(datetime.timezone.utc), usegmt=True
+        ),
+        # Responses depend on the caller's token: never share them, and
+        # always revalidate
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    body = response_cache.get(key)
+    if body is None:
+        body = orjson.dumps(build())
+        response_cache.set(key, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,239 @@
+import asyncio
+import base64
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import orjson
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.cache import async_r, is_redis_unavailable
+from app.config import get_settings
+from app.metrics import Counter
+from app.singleflight import SingleFlight
+
+# Idempotency-Key support for POST endpoints that clients retry. The first
+# request with a key claims it in Redis and runs; its response is stored
+# for a short TTL and replayed to duplicates. Duplicates arriving while it
+# runs wait for it: in the same worker they share its task, in other
+# workers they poll the claim. 5xx responses are not stored, so a retry
+# after a failure runs again. Cookies are not stored: a replay returns the
+# body without the Set-Cookie of the original (on verification, the
+# refresh token), so the record does not hold a session credential.
+# Without Redis requests run as if no key was sent
+
+IDEMPOTENCY_KEY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+SET_COOKIE_HEADER = b"set-cookie"
+MAX_KEY_LENGTH = 255
+
+idempotent_requests = Counter(
+    "idempotent_requests_total",
+    "Requests carrying an Idempotency-Key, by path and outcome "
+    "(executed, replayed, mismatch, in_progress, unavailable)",
+)
+
+
+@dataclass(slots=True)
+class CapturedResponse:
+    status: int = 500
+    headers: list[tuple[bytes, bytes]] = field(default_factory=list)
+    body: bytes = b""
+
+    def encode(self, fingerprint: str):
+        return orjson.dumps(
+            {
+                "fingerprint": fingerprint,
+                "status": self.status,
+                "headers": [
+                    [name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in self.headers
+                    if name.lower() != SET_COOKIE_HEADER
+                ],
+                "body": base64.b64encode(self.body).decode(),
+            }
+        )
+
+    @classmethod
+    def decode(cls, record: dict):
+        return cls(
+            record["status"],
+            [
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in record["headers"]
+            ],
+            base64.b64decode(record["body"]),
+        )
+
+    async def send(self, send: Send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                "headers": self.headers,
+            }
+        )
+        await send({"type": "http.response.body", "body": self.body})
+
+
+def error_response(status: int, detail: str, retry_after: Optional[int] = None):
+    headers = [(b"content-type", b"application/json")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(retry_after).encode()))
+    return CapturedResponse(status, headers, orjson.dumps({"detail": detail}))
+
+
+async def read_body(receive: Receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def capture(app: ASGIApp, scope: Scope, receive: Receive, body: bytes):
+    # Runs the request with its already-read body and buffers the response
+    response = CapturedResponse()
+    body_sent = False
+    chunks = []
+
+    async def replay_body():
+        nonlocal body_sent
+        if body_sent:
+            return await receive()
+        body_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def capture_send(message: Message):
+        if message["type"] == "http.response.start":
+            response.status = message["status"]
+            response.headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, replay_body, capture_send)
+    response.body = b"".join(chunks)
+    return response
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp, paths: Iterable[str]):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.flights = SingleFlight("idempotency")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            return await self.app(scope, receive, send)
+
+        key = next(
+            (
+                value.decode("latin-1")
+                for name, value in scope["headers"]
+                if name == IDEMPOTENCY_KEY_HEADER
+            ),
+            None,
+        )
+        if key is None:
+            return await self.app(scope, receive, send)
+        if not 0 < len(key) <= MAX_KEY_LENGTH:
+            return await error_response(400, "Invalid Idempotency-Key").send(send)
+
+        body = await read_body(receive)
+        record_key = f"idempotency:{scope['path']}:{key}"
+        fingerprint = hashlib.sha256(body).hexdigest()
+        response = await self.flights.do(
+            (record_key, fingerprint),
+            lambda: self._once(scope, receive, body, record_key, fingerprint),
+        )
+        await response.send(send)
+
+    async def _once(
+        self,
+        scope: Scope,
+        receive: Receive,
+        body: bytes,
+        record_key: str,
+        fingerprint: str,
+    ):
+        settings = get_settings()
+        path = scope["path"]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.idempotency_lock_ms / 1000
+        delay = 0.005
+
+        try:
+            while not await async_r.set(
+                record_key,
+                orjson.dumps({"fingerprint": fingerprint}),
+                nx=True,
+                px=settings.idempotency_lock_ms,
+            ):
+                record = await async_r.get(record_key)
+                if record is None:
+                    # The original failed or its claim expired: claim again
+                    continue
+                record = orjson.loads(record)
+                if record["fingerprint"] != fingerprint:
+                    idempotent_requests.inc(path=path, result="mismatch")
+                    return error_response(
+                        422, "Idempotency-Key was used for a different request"
+                    )
+                if "status" in record:
+                    idempotent_requests.inc(path=path, result="replayed")
+                    response = CapturedResponse.decode(record)
+                    response.headers.append((REPLAYED_HEADER, b"true"))
+                    return response
+                if loop.time() + delay > deadline:
+                    idempotent_requests.inc(path=path, result="in_progress")
+                    return error_response(
+                        409,
+                        "A request with this Idempotency-Key is in progress",
+                        retry_after=1,
+                    )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        except Exception as e:
+            if not is_redis_unavailable(e):
+                raise
+            logging.error(f"Idempotency keys unavailable: {str(e)}")
+            idempotent_requests.inc(path=path, result="unavailable")
+            return await capture(self.app, scope, receive, body)
+
+        idempotent_requests.inc(path=path, result="executed")
+        try:
+            response = await capture(self.app, scope, receive, body)
+        except BaseException:
+            await self._release(record_key)
+            raise
+
+        try:
+            if response.status < 500:
+                await async_r.set(
+                    record_key,
+                    response.encode(fingerprint),
+                    ex=settings.idempotency_ttl_seconds,
+                )
+            else:
+                await async_r.delete(record_key)
+        except Exception as e:
+            if not is_redis_unavailable(e):
+                raise
+            logging.error(f"Failed to store idempotent response: {str(e)}")
+        return response
+
+    async def _release(self, record_key: str):
+        # Duplicates would otherwise wait for the claim to expire
+        try:
+            await async_r.delete(record_key)
+        except Exception as e:
+            logging.error(f"Failed to release idempotency key: {str(e)}")
@@ -0,0 +1,128 @@
+import datetime
+import uuid
+from typing import Awaitable, Callable, Iterable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import UserGender, UserStatus
+from app.validators import email_validator, name_validator, username_validator
+
+IMPORT_COLUMNS = (
+    "id",
+    "created_at",
+    "updated_at",
+    "email",
+    "username",
+    "name",
+    "gender",
+    "status",
+    "is_private",
+)
+
+EXPORT_QUERY = """
+    SELECT id, email, username, name, gender, status, created_at
+    FROM users
+    WHERE status <> 'deleted'
+    ORDER BY created_at, id
+"""
+
+
+def validate_rows(rows: Iterable[tuple[int, dict]]):
+    # Validates a batch of CSV rows with the same rules as the User model
+    # @validates hooks, without instantiating ORM objects
+    records = []
+    rejects = []
+    emails = set()
+    usernames = set()
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    for line, row in rows:
+        try:
+            email = email_validator(row.get("email") or "")
+            username = username_validator(row.get("username") or "")
+            name = name_validator(row.get("name") or "")
+            gender = UserGender(row.get("gender") or UserGender.prefer_not_to_say)
+
+            if email.lower() in emails:
+                raise ValueError("Duplicate email in import")
+            if username.lower() in usernames:
+                raise ValueError("Duplicate username in import")
+        except ValueError as e:
+            rejects.append({"line": line, "email": row.get("email"), "error": str(e)})
+            continue
+
+        emails.add(email.lower())
+        usernames.add(username.lower())
+        records.append(
+            (
+                line,
+                uuid.uuid4(),
+                now,
+                now,
+                email,
+                username,
+                name,
+                gender.name,
+                UserStatus.active.name,
+                False,
+            )
+        )
+
+    return records, rejects
+
+
+async def import_users(db: AsyncSession, records: list[tuple]):
+    # Streams a validated batch, (line, *IMPORT_COLUMNS) records from
+    # validate_rows, into a transaction scoped staging table with COPY, then
+    # merges it. Rows that conflict on email/username are returned as rejects
+    try:
+        await db.execute(
+            text(
+                "CREATE TEMP TABLE users_import "
+                "(LIKE users INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+        )
+
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            "users_import",
+            records=[record[1:] for record in records],
+            columns=IMPORT_COLUMNS,
+        )
+
+        columns = ", ".join(IMPORT_COLUMNS)
+        inserted_query = await db.execute(
+            text(
+                f"INSERT INTO users ({columns}) "
+                f"SELECT {columns} FROM users_import "
+                "ON CONFLICT DO NOTHING "
+                "RETURNING id"
+            )
+        )
+        inserted = {row.id for row in inserted_query}
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+    conflicts = [
+        {"line": record[0], "email": record[4], "error": "User already exists"}
+        for record in records
+        if record[1] not in inserted
+    ]
+    return len(inserted), conflicts
+
+
+async def export_users(db: AsyncSession, output: Callable[[bytes], Awaitable]):
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_from_query(
+        EXPORT_QUERY,
+        output=output,
+        format="csv",
+        header=True,
+    )
+    await db.commit()
@@ -0,0 +1,49 @@
+import asyncio
+from datetime import datetime, timezone
+
+import resend
+
+from app.config import get_settings
+from app.jobs import job
+
+resend.api_key = get_settings().resend_api_key
+
+
+def generate_email_html(
+    origin: str,
+    code: str,
+    token: str,
+    is_new_user: bool,
+    expiry_minutes: int,
+):
+    login_url = f"{origin}/login?token={token}&is-new-user={is_new_user}"
+    current_year = datetime.now(timezone.utc).year
+
+    return f"""<body style="background-color: white"> <table align="center" width="100%" border="0" cellpadding="0" cellspacing="0" role="presentation" style=" max-width: 37.5em; padding-left: 12px; padding-right: 12px; margin: 0 auto; " > <tbody> <tr style="width: 100%"> <td> <h1 style=" color: black; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; font-size: 24px; font-weight: bold; margin: 40px 0; padding: 0; " > Log in to Connector </h1> <p style=" font-size: 14px; line-height: 24px; margin-bottom: 14px; margin-top: 16px; color: black; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; margin: 24px 0; " > To complete the log in process; enter the verification code in the original window, or enter it in a new one by going to the link below: </p> <code style=" display: inline-block; padding: 16px 4.5%; width: 90.5%; background-color: #f5f5f5; border-radius: 5px; border: 1px; color: black; " >{code}</code > <a href="{login_url}" style=" color: #216fdb; text-decoration-line: none; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; font-size: 14px; text-decoration: underline; display: block; margin: 24px 0; " target="_blank" >{login_url}</a > <p style=" font-size: 14px; line-height: 24px; color: black; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; margin: 24px 0; " > This link and code will only be valid for the next {expiry_minutes} minutes. </p> <p style=" font-size: 14px; line-height: 24px; color: #999999; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; margin: 24px 0; " > If you didn't try to log in, you can safely ignore this email. </p> <hr style="width: 100%; border: none; border-top: 1px solid #e5e5e5" /> <p style=" font-size: 14px; line-height: 22px; color: #999999; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; margin: 24px 0; " > © {current_year} Connector Inc. </p> </td> </tr> </tbody> </table> </body>"""
+
+
+@job(queue="email")
+async def send_verification_email(
+    origin: str,
+    to_email: str,
+    code: str,
+    token: str,
+    is_new_user: bool,
+):
+    html = generate_email_html(
+        origin,
+        code,
+        token,
+        is_new_user,
+        get_settings().verification_email_expiry_minutes,
+    )
+
+    params: resend.Emails.SendParams = {
+        "from": f"Connector <{get_settings().sender_email}>",
+        "to": [to_email],
+        "subject": f"{code} - Log in to Connector ",
+        "html": html,
+    }
+
+    # The Resend client is blocking. Errors propagate so the job is retried
+    await asyncio.to_thread(resend.Emails.send, params)
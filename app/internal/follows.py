@@ -0,0 +1,374 @@
+import asyncio
+import base64
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID
+
+import orjson
+import redis.asyncio
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import async_r, is_redis_unavailable
+from app.config import get_settings
+from app.database import async_session
+from app.internal.stats import update_user_stats
+from app.internal.users import IS_ACTIVE
+from app.models import Follow, FollowRequest, User
+
+# Follower sets are only cached for hot accounts. A set always contains the
+# empty-string sentinel, so an empty follower list still reads as cached
+SENTINEL = ""
+
+# Writes must not create partial sets for accounts that are not cached
+UPDATE_IF_EXISTS = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call(ARGV[1], key, ARGV[2])
+    end
+end
+"""
+update_if_exists = async_r.register_script(UPDATE_IF_EXISTS)
+
+
+# Both keys of an account share its hash tag: they are updated by one script
+# and renamed into each other, which Redis Cluster only allows within a slot
+def followers_key(user_id: UUID):
+    return f"followers:{{{user_id}}}"
+
+
+def followers_building_key(user_id: UUID):
+    return f"followers:{{{user_id}}}:building"
+
+
+@dataclass(slots=True)
+class FollowUser:
+    username: str
+    name: str
+    profile_picture: Optional[str]
+
+
+async def update_followers_cache(
+    redis: redis.asyncio.Redis,
+    followee_id: UUID,
+    follower_id: UUID,
+    command: str,
+):
+    # Runs after the follow is committed, so it must not fail the request.
+    # A set that missed an update is dropped rather than kept: a stale SREM
+    # would keep showing an unfollower a private account
+    keys = [followers_key(followee_id), followers_building_key(followee_id)]
+    try:
+        await update_if_exists(
+            keys=keys,
+            args=[command, str(follower_id)],
+            client=redis,
+        )
+    except Exception as e:
+        logging.error(f"Failed to update followers cache: {str(e)}")
+        try:
+            await redis.delete(*keys)
+        except Exception as e:
+            logging.error(f"Failed to drop followers cache: {str(e)}")
+
+
+async def add_follow(db: AsyncSession, follower_id: UUID, followee_id: UUID):
+    # In the caller's transaction; returns whether the follow is new
+    follow_query = await db.execute(
+        insert(Follow)
+        .values(follower_id=follower_id, followee_id=followee_id)
+        .on_conflict_do_nothing()
+        .returning(Follow.created_at)
+    )
+    created = follow_query.first() is not None
+    if created:
+        await update_user_stats(db, {followee_id: (0, 1, 0), follower_id: (0, 0, 1)})
+    return created
+
+
+async def follow_user(
+    db: AsyncSession,
+    redis: redis.asyncio.Redis,
+    follower_id: UUID,
+    followee_id: UUID,
+):
+    try:
+        created = await add_follow(db, follower_id, followee_id)
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+    if created:
+        await update_followers_cache(redis, followee_id, follower_id, "SADD")
+    return created
+
+
+async def unfollow_user(
+    db: AsyncSession,
+    redis: redis.asyncio.Redis,
+    follower_id: UUID,
+    followee_id: UUID,
+):
+    try:
+        unfollow_query = await db.execute(
+            delete(Follow)
+            .where(
+                Follow.follower_id == follower_id,
+                Follow.followee_id == followee_id,
+            )
+            .returning(Follow.created_at)
+        )
+        deleted = unfollow_query.first() is not None
+        if deleted:
+            await update_user_stats(
+                db, {followee_id: (0, -1, 0), follower_id: (0, 0, -1)}
+            )
+        # Unfollowing also withdraws a pending request
+        await db.execute(
+            delete(FollowRequest).where(
+                FollowRequest.follower_id == follower_id,
+                FollowRequest.followee_id == followee_id,
+            )
+        )
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+    if deleted:
+        await update_followers_cache(redis, followee_id, follower_id, "SREM")
+    return deleted
+
+
+async def request_follow(db: AsyncSession, follower_id: UUID, followee_id: UUID):
+    try:
+        request_query = await db.execute(
+            insert(FollowRequest)
+            .values(follower_id=follower_id, followee_id=followee_id)
+            .on_conflict_do_nothing()
+            .returning(FollowRequest.created_at)
+        )
+        created = request_query.first() is not None
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+    return created
+
+
+async def answer_follow_request(
+    db: AsyncSession,
+    redis: redis.asyncio.Redis,
+    follower_id: UUID,
+    followee_id: UUID,
+    approve: bool,
+):
+    # Returns whether there was a pending request
+    try:
+        request_query = await db.execute(
+            delete(FollowRequest)
+            .where(
+                FollowRequest.follower_id == follower_id,
+                FollowRequest.followee_id == followee_id,
+            )
+            .returning(FollowRequest.created_at)
+        )
+        pending = request_query.first() is not None
+        created = pending and approve and await add_follow(db, follower_id, followee_id)
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+    if created:
+        await update_followers_cache(redis, followee_id, follower_id, "SADD")
+    return pending
+
+
+async def warm_followers_cache(redis: redis.asyncio.Redis, user_id: UUID):
+    # Built under a separate key and renamed into place; follows/unfollows
+    # that happen meanwhile are applied to the building key as well
+    building_key = followers_building_key(user_id)
+    await redis.delete(building_key)
+    await redis.sadd(building_key, SENTINEL)
+
+    async with async_session() as db:
+        cursor = None
+        while True:
+            query = (
+                select(Follow.created_at, Follow.follower_id)
+                .where(Follow.followee_id == user_id)
+                .order_by(Follow.created_at, Follow.follower_id)
+                .limit(get_settings().follow_page_size * 100)
+            )
+            if cursor:
+                query = query.where(
+                    tuple_(Follow.created_at, Follow.follower_id) > cursor
+                )
+
+            rows = (await db.execute(query)).all()
+            if not rows:
+                break
+            await redis.sadd(building_key, *(str(row.follower_id) for row in rows))
+            cursor = tuple(rows[-1])
+
+    pipe = redis.pipeline()
+    pipe.rename(building_key, followers_key(user_id))
+    pipe.expire(followers_key(user_id), get_settings().follow_cache_ttl_seconds)
+    await pipe.execute()
+
+
+warming_tasks: set[asyncio.Task] = set()
+
+
+async def schedule_warm_followers_cache(redis: redis.asyncio.Redis, user_id: UUID):
+    # One warm-up per account across all workers
+    if not await redis.set(f"followers:{user_id}:warming", 1, nx=True, ex=60):
+        return
+
+    async def warm():
+        try:
+            await warm_followers_cache(redis, user_id)
+        except Exception as e:
+            logging.error(f"Failed to warm followers cache: {str(e)}")
+
+    task = asyncio.create_task(warm())
+    warming_tasks.add(task)
+    task.add_done_callback(warming_tasks.discard)
+
+
+async def has_follow(db: AsyncSession, follower_id: UUID, followee_id: UUID):
+    follow_query = await db.execute(
+        select(Follow.created_at).where(
+            Follow.follower_id == follower_id,
+            Follow.followee_id == followee_id,
+        )
+    )
+    return follow_query.first() is not None
+
+
+async def is_following(
+    db: AsyncSession,
+    redis: redis.asyncio.Redis,
+    follower_id: UUID,
+    followee_id: UUID,
+):
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.exists(followers_key(followee_id))
+        pipe.sismember(followers_key(followee_id), str(follower_id))
+        cached, member = await pipe.execute()
+    except Exception as e:
+        # The cache is only an optimization, Postgres has the answer
+        if not is_redis_unavailable(e):
+            raise
+        return await has_follow(db, follower_id, followee_id)
+
+    if cached:
+        return bool(member)
+
+    following = await has_follow(db, follower_id, followee_id)
+
+    # Accounts checked often enough within a minute get a cached follower set
+    checks_key = f"follow_checks:{followee_id}"
+    pipe = redis.pipeline(transaction=False)
+    pipe.incr(checks_key)
+    pipe.expire(checks_key, 60, nx=True)
+    checks, _ = await pipe.execute()
+    if checks >= get_settings().follow_cache_hot_threshold:
+        await schedule_warm_followers_cache(redis, followee_id)
+
+    return following
+
+
+def encode_cursor(created_at: datetime.datetime, user_id: UUID):
+    return base64.urlsafe_b64encode(
+        orjson.dumps([created_at.isoformat(), str(user_id)])
+    ).decode()
+
+
+def decode_cursor(cursor: str):
+    created_at, user_id = orjson.loads(base64.urlsafe_b64decode(cursor))
+    return datetime.datetime.fromisoformat(created_at), UUID(user_id)
+
+
+async def list_follows(
+    db: AsyncSession,
+    user_id: UUID,
+    followers: bool,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+):
+    # Newest first, paginated by (created_at, other user id) instead of
+    # OFFSET so deep pages cost the same as the first one
+    own_column, other_column = (
+        (Follow.followee_id, Follow.follower_id)
+        if followers
+        else (Follow.follower_id, Follow.followee_id)
+    )
+
+    query = (
+        select(
+            User.username,
+            User.name,
+            User.profile_picture,
+            Follow.created_at,
+            other_column,
+        )
+        .join(User, User.id == other_column)
+        .where(own_column == user_id, IS_ACTIVE)
+        .order_by(Follow.created_at.desc(), other_column.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.where(
+            tuple_(Follow.created_at, other_column) < decode_cursor(cursor)
+        )
+
+    rows = (await db.execute(query)).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1][3], page[-1][4]) if len(rows) > limit else None
+
+    return [FollowUser(row[0], row[1], row[2]) for row in page], next_cursor
+
+
+async def list_follow_requests(
+    db: AsyncSession,
+    user_id: UUID,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+):
+    # Newest first, paginated like list_follows
+    query = (
+        select(
+            User.username,
+            User.name,
+            User.profile_picture,
+            FollowRequest.created_at,
+            FollowRequest.follower_id,
+        )
+        .join(User, User.id == FollowRequest.follower_id)
+        .where(FollowRequest.followee_id == user_id, IS_ACTIVE)
+        .order_by(FollowRequest.created_at.desc(), FollowRequest.follower_id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.where(
+            tuple_(FollowRequest.created_at, FollowRequest.follower_id)
+            < decode_cursor(cursor)
+        )
+
+    rows = (await db.execute(query)).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1][3], page[-1][4]) if len(rows) > limit else None
+
+    return [FollowUser(row[0], row[1], row[2]) for row in page], next_cursor
@@ -0,0 +1,55 @@
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from app.config import get_settings
+
+# These functions run in worker processes so that decoding and encoding
+# images never blocks the event loop
+
+
+def make_thumbnail(source: str, destination: str, size: int):
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        image.convert("RGB").save(destination, "WEBP", quality=80)
+
+
+def make_profile_picture(source: str, destination: str, size: int):
+    # Re-encoding strips metadata (EXIF, GPS) from the original upload
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image.convert("RGB"), (size, size))
+        image.save(destination, "WEBP", quality=85)
+
+    with open(destination, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=get_settings().media_process_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def run_in_process(function, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), function, *args)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,247 @@
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+import anyio.to_thread
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import get_settings
+from app.internal.images import make_profile_picture, make_thumbnail, run_in_process
+from app.storage import Storage
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "video/mp4": ".mp4",
+}
+
+
+def sniff_content_type(head: bytes):
+    # Trust the file signature, not the client supplied Content-Type
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return "video/mp4"
+    return None
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@dataclass(slots=True)
+class StoredMedia:
+    url: str
+    thumbnail_url: Optional[str]
+    content_type: str
+    size: int
+    sha256: str
+
+
+class UploadedFile:
+    # Spools one multipart part to a local temporary file in fixed-size
+    # chunks, hashing as it goes. Created with UploadedFile.create, which
+    # opens the file off the event loop like the writes
+
+    def __init__(self, filename: str, path: str, file: BinaryIO):
+        self.filename = filename
+        self.path = path
+        self.size = 0
+        self.content_type: Optional[str] = None
+        self.sha256: Optional[str] = None
+        self._hasher = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = file
+
+    @classmethod
+    async def create(cls, storage: Storage, filename: str):
+        path = storage.temp_path()
+        file = await anyio.to_thread.run_sync(open, path, "wb")
+        return cls(filename, path, file)
+
+    def _write_chunk(self, chunk: bytes):
+        self._file.write(chunk)
+        self._hasher.update(chunk)
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > get_settings().media_max_bytes:
+            raise ValueError("File is too large")
+
+        self._buffer += data
+        if self.content_type is None and len(self._buffer) >= 16:
+            self.content_type = sniff_content_type(bytes(self._buffer[:16]))
+            if self.content_type is None:
+                raise ValueError("Unsupported file type")
+
+        chunk_size = get_settings().media_chunk_size
+        while len(self._buffer) >= chunk_size:
+            chunk = bytes(self._buffer[:chunk_size])
+            del self._buffer[:chunk_size]
+            await anyio.to_thread.run_sync(self._write_chunk, chunk)
+
+    async def finish(self):
+        if self.content_type is None:
+            self.content_type = sniff_content_type(bytes(self._buffer[:16]))
+        if self._buffer:
+            await anyio.to_thread.run_sync(self._write_chunk, bytes(self._buffer))
+            self._buffer.clear()
+        await anyio.to_thread.run_sync(self._file.close)
+
+        if self.content_type is None:
+            raise ValueError("Unsupported file type")
+        self.sha256 = self._hasher.hexdigest()
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        remove_file(self.path)
+
+
+async def receive_files(request: Request, storage: Storage, max_files: int):
+    content_type, params = parse_options_header(request.headers.get("Content-Type"))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise ValueError("Expected a multipart/form-data body")
+
+    # The parser callbacks are synchronous; they only record events which
+    # are then applied asynchronously after each network chunk
+    events = []
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        events.append(("header", bytes(header_field).lower(), bytes(header_value)))
+        header_field.clear()
+        header_value.clear()
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": lambda: events.append(("begin",)),
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": lambda: events.append(("headers_finished",)),
+            "on_part_data": lambda data, start, end: events.append(
+                ("data", bytes(data[start:end]))
+            ),
+            "on_part_end": lambda: events.append(("end",)),
+        },
+    )
+
+    files: list[UploadedFile] = []
+    current: Optional[UploadedFile] = None
+    filename: Optional[str] = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event in events:
+                match event:
+                    case ("begin",):
+                        filename = None
+                    case ("header", b"content-disposition", value):
+                        _, options = parse_options_header(value)
+                        name = options.get(b"filename")
+                        filename = name.decode() if name is not None else None
+                    case ("headers_finished",):
+                        # Plain form fields are skipped
+                        if filename is not None:
+                            if len(files) >= max_files:
+                                raise ValueError("Too many files")
+                            current = await UploadedFile.create(storage, filename)
+                            files.append(current)
+                    case ("data", data) if current is not None:
+                        await current.write(data)
+                    case ("end",):
+                        if current is not None:
+                            await current.finish()
+                        current = None
+            events.clear()
+        parser.finalize()
+
+        if not files or current is not None:
+            raise ValueError("No file received")
+        return files
+
+    except BaseException:
+        for file in files:
+            file.discard()
+        raise
+
+
+async def store_media(storage: Storage, file: UploadedFile):
+    digest = file.sha256
+    key = f"{digest}{CONTENT_TYPE_EXTENSIONS[file.content_type]}"
+    thumbnail_key = f"{digest}_thumbnail.webp"
+    is_image = file.content_type.startswith("image/")
+
+    try:
+        if is_image and not await storage.exists(thumbnail_key):
+            thumbnail_path = storage.temp_path()
+            try:
+                await run_in_process(
+                    make_thumbnail,
+                    file.path,
+                    thumbnail_path,
+                    get_settings().media_thumbnail_size,
+                )
+                await storage.put(thumbnail_key, thumbnail_path)
+            finally:
+                remove_file(thumbnail_path)
+
+        # Content addressed keys deduplicate identical uploads
+        if not await storage.exists(key):
+            await storage.put(key, file.path)
+    finally:
+        file.discard()
+
+    return StoredMedia(
+        storage.url(key),
+        storage.url(thumbnail_key) if is_image else None,
+        file.content_type,
+        file.size,
+        digest,
+    )
+
+
+async def store_profile_picture(storage: Storage, file: UploadedFile):
+    if not file.content_type.startswith("image/"):
+        file.discard()
+        raise ValueError("Profile picture must be an image")
+
+    path = storage.temp_path()
+    try:
+        digest = await run_in_process(
+            make_profile_picture,
+            file.path,
+            path,
+            get_settings().media_profile_picture_size,
+        )
+        key = f"{digest}.webp"
+        if not await storage.exists(key):
+            await storage.put(key, path)
+    finally:
+        file.discard()
+        remove_file(path)
+
+    return storage.url(key)
@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+import logging
+from collections import defaultdict
+from uuid import UUID
+
+from sqlalchemy import delete, or_, select, tuple_
+
+from app.cache import async_r
+from app.config import get_settings
+from app.database import async_session
+from app.internal.stats import update_user_stats
+from app.internal.users import IS_DELETED, users
+from app.models import Follow, Post
+
+posts = Post.__table__
+follows = Follow.__table__
+
+# Deleted users are hard-deleted with everything they own. Every step works
+# through bounded batches, one short transaction each, so the purge never
+# holds many row locks or long transactions on users, posts or follows
+
+
+async def purge_posts(user_ids: list[UUID], batch_size: int):
+    purged = 0
+    while True:
+        batch = (
+            select(posts.c.id).where(posts.c.user_id.in_(user_ids)).limit(batch_size)
+        )
+        async with async_session() as db:
+            result = await db.execute(delete(posts).where(posts.c.id.in_(batch)))
+            await db.commit()
+        purged += result.rowcount
+        if result.rowcount < batch_size:
+            return purged
+
+
+async def purge_follows(user_ids: list[UUID], batch_size: int):
+    # Edges to surviving users also lower those users' counters
+    purged_ids = set(user_ids)
+    purged = 0
+    while True:
+        batch = (
+            select(follows.c.follower_id, follows.c.followee_id)
+            .where(
+                or_(
+                    follows.c.follower_id.in_(user_ids),
+                    follows.c.followee_id.in_(user_ids),
+                )
+            )
+            .limit(batch_size)
+        )
+        async with async_session() as db:
+            result = await db.execute(
+                delete(follows)
+                .where(tuple_(follows.c.follower_id, follows.c.followee_id).in_(batch))
+                .returning(follows.c.follower_id, follows.c.followee_id)
+            )
+            rows = result.all()
+
+            deltas: dict[UUID, list[int]] = defaultdict(lambda: [0, 0, 0])
+            for follower_id, followee_id in rows:
+                if follower_id not in purged_ids:
+                    deltas[follower_id][2] -= 1
+                if followee_id not in purged_ids:
+                    deltas[followee_id][1] -= 1
+            await update_user_stats(
+                db, {user_id: tuple(delta) for user_id, delta in deltas.items()}
+            )
+            await db.commit()
+
+        purged += len(rows)
+        if len(rows) < batch_size:
+            return purged
+
+
+async def purge_deleted_users():
+    settings = get_settings()
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        days=settings.user_purge_grace_days
+    )
+    total = 0
+    while True:
+        async with async_session() as db:
+            result = await db.execute(
+                select(users.c.id)
+                .where(IS_DELETED, users.c.updated_at < cutoff)
+                .order_by(users.c.updated_at)
+                .limit(settings.user_purge_users_per_batch)
+            )
+            user_ids = list(result.scalars())
+        if not user_ids:
+            return total
+
+        await purge_posts(user_ids, settings.user_purge_batch_size)
+        await purge_follows(user_ids, settings.user_purge_batch_size)
+
+        # user_stats rows go with the users through ON DELETE CASCADE
+        async with async_session() as db:
+            result = await db.execute(
+                delete(users).where(users.c.id.in_(user_ids), IS_DELETED)
+            )
+            await db.commit()
+        total += result.rowcount
+
+
+async def run_user_purger():
+    interval = get_settings().user_purge_interval_seconds
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Only one worker across the deployment purges per interval
+            if await async_r.set("user_purge:lock", 1, nx=True, ex=interval):
+                started = datetime.datetime.now(datetime.timezone.utc)
+                purged = await purge_deleted_users()
+                logging.info(
+                    f"Purged {purged} deleted users in "
+                    f"{datetime.datetime.now(datetime.timezone.utc) - started}"
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Failed to purge deleted users: {str(e)}")
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import Optional
+
+import orjson
+import redis
+import redis.asyncio
+
+from app.cache import async_r, pubsub_r
+from app.config import get_settings
+
+CHANNEL_PREFIX = "realtime:user:"
+
+
+class Subscriber:
+    __slots__ = ("user_id", "queue", "closed", "reason")
+
+    def __init__(self, user_id: str, maxsize: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+        self.reason: Optional[str] = None
+
+    def push(self, message: str):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: drop its backlog and disconnect it instead of
+            # letting the queue grow without bound
+            self.close("slow_consumer")
+
+    def close(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        self.reason = reason
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        # None tells the connection loop to stop
+        self.queue.put_nowait(None)
+
+
+class RealtimeHub:
+    # One pattern subscription per worker; messages are fanned out to the
+    # local connections of the addressed user
+    def __init__(self, client: redis.asyncio.Redis):
+        self._client = client
+        self._subscribers: dict[str, set[Subscriber]] = {}
+        self._connections = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connections(self):
+        return self._connections
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for subscribers in list(self._subscribers.values()):
+            for subscriber in list(subscribers):
+                subscriber.close("shutdown")
+
+    @property
+    def full(self):
+        return self._connections >= get_settings().realtime_max_connections
+
+    def subscribe(self, user_id: str):
+        if self.full:
+            return None
+
+        subscriber = Subscriber(user_id, get_settings().realtime_queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        self._connections += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if not subscribers or subscriber not in subscribers:
+            return
+
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.user_id]
+        self._connections -= 1
+
+    def dispatch(self, channel: str, data: str):
+        subscribers = self._subscribers.get(channel[len(CHANNEL_PREFIX) :])
+        if not subscribers:
+            return
+        for subscriber in list(subscribers):
+            subscriber.push(data)
+
+    async def _run(self):
+        while True:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    data = message["data"]
+                    self.dispatch(
+                        channel.decode() if isinstance(channel, bytes) else channel,
+                        data.decode() if isinstance(data, bytes) else data,
+                    )
+            except asyncio.CancelledError:
+                raise
+            except redis.RedisError as e:
+                logging.error(f"Realtime subscription failed: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+hub = RealtimeHub(pubsub_r)
+
+
+async def publish_to_user(user_id: str, event: dict):
+    await async_r.publish(f"{CHANNEL_PREFIX}{user_id}", orjson.dumps(event))
@@ -0,0 +1,171 @@
+import asyncio
+import datetime
+import logging
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import async_r
+from app.config import get_settings
+from app.database import async_session
+from app.models import Follow, Post, User, UserStats
+
+
+async def update_user_stats(
+    db: AsyncSession,
+    deltas: dict[UUID, tuple[int, int, int]],
+):
+    # Applies (posts, followers, following) deltas in the caller's transaction.
+    # Rows are upserted in id order so concurrent writers lock them in the
+    # same order and cannot deadlock. Counts never go below zero, also when
+    # the row is created by a negative delta
+    if not deltas:
+        return
+
+    statement = insert(UserStats).values(
+        [
+            {
+                "user_id": user_id,
+                "posts_count": max(posts, 0),
+                "followers_count": max(followers, 0),
+                "following_count": max(following, 0),
+            }
+            for user_id, (posts, followers, following) in sorted(deltas.items())
+        ]
+    )
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                "posts_count": func.greatest(
+                    UserStats.posts_count + statement.excluded.posts_count, 0
+                ),
+                "followers_count": func.greatest(
+                    UserStats.followers_count + statement.excluded.followers_count, 0
+                ),
+                "following_count": func.greatest(
+                    UserStats.following_count + statement.excluded.following_count, 0
+                ),
+                "updated_at": statement.excluded.updated_at,
+            },
+        )
+    )
+
+
+async def reconcile_user_stats(
+    db: AsyncSession,
+    after: Optional[UUID],
+    batch_size: int,
+):
+    # Recounts one batch of users from the source tables and rewrites only
+    # the rows that drifted. Returns the last user id of the batch, or None
+    # when the table has been fully scanned
+    batch_query = select(User.id).order_by(User.id).limit(batch_size)
+    if after is not None:
+        batch_query = batch_query.where(User.id > after)
+    user_ids = (await db.execute(batch_query)).scalars().all()
+    if not user_ids:
+        return None, 0
+
+    # Lock the batch's counters before counting. Writers changing them wait
+    # for this transaction, and the counts below (a new snapshot) include
+    # every write that committed before, so no delta is overwritten.
+    # Missing rows are created first so they can be locked too
+    await db.execute(
+        insert(UserStats)
+        .values(
+            [
+                {
+                    "user_id": user_id,
+                    "posts_count": 0,
+                    "followers_count": 0,
+                    "following_count": 0,
+                }
+                for user_id in user_ids
+            ]
+        )
+        .on_conflict_do_nothing()
+    )
+    await db.execute(
+        select(UserStats.user_id)
+        .where(UserStats.user_id.in_(user_ids))
+        .order_by(UserStats.user_id)
+        .with_for_update()
+    )
+
+    def count(column):
+        return select(func.count()).where(column == User.id).scalar_subquery()
+
+    actual = select(
+        User.id,
+        count(Post.user_id),
+        count(Follow.followee_id),
+        count(Follow.follower_id),
+        func.now(),
+    ).where(User.id.in_(user_ids))
+
+    statement = insert(UserStats).from_select(
+        [
+            UserStats.user_id,
+            UserStats.posts_count,
+            UserStats.followers_count,
+            UserStats.following_count,
+            UserStats.updated_at,
+        ],
+        actual,
+    )
+    fixed_query = await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                "posts_count": statement.excluded.posts_count,
+                "followers_count": statement.excluded.followers_count,
+                "following_count": statement.excluded.following_count,
+                "updated_at": statement.excluded.updated_at,
+            },
+            where=(
+                (UserStats.posts_count != statement.excluded.posts_count)
+                | (UserStats.followers_count != statement.excluded.followers_count)
+                | (UserStats.following_count != statement.excluded.following_count)
+            ),
+        ).returning(UserStats.user_id)
+    )
+    fixed = len(fixed_query.all())
+    await db.commit()
+
+    return user_ids[-1], fixed
+
+
+async def reconcile_all_user_stats():
+    batch_size = get_settings().stats_reconcile_batch_size
+    after = None
+    total = 0
+    while True:
+        # A short transaction per batch keeps row locks brief
+        async with async_session() as db:
+            after, fixed = await reconcile_user_stats(db, after, batch_size)
+        total += fixed
+        if after is None:
+            return total
+
+
+async def run_stats_reconciler():
+    interval = get_settings().stats_reconcile_interval_seconds
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Only one worker across the deployment reconciles per interval
+            if await async_r.set("stats_reconcile:lock", 1, nx=True, ex=interval):
+                started = datetime.datetime.now(datetime.timezone.utc)
+                fixed = await reconcile_all_user_stats()
+                logging.info(
+                    f"Reconciled user stats: {fixed} rows fixed in "
+                    f"{datetime.datetime.now(datetime.timezone.utc) - started}"
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Failed to reconcile user stats: {str(e)}")
@@ -1,11 +1,51 @@
+import datetime
+from dataclasses import dataclass
 from typing import Optional
 from uuid import UUID
 
+import orjson
 from pydantic import EmailStr
-from sqlalchemy import or_, select
+from sqlalchemy import literal_column, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import User, UserGender
+from app.config import get_settings
+from app.database import is_database_unavailable, read_session
+from app.models import User, UserGender, UserStats, UserStatus
+from app.resilience import StaleCache, retry
+from app.singleflight import SharedSingleFlight
+
+users = User.__table__
+
+# Literal rather than bound statuses: the planner can then prove they imply
+# the partial index predicates, even for generic prepared-statement plans
+IS_ACTIVE = users.c.status == literal_column("'active'")
+IS_LIVE = users.c.status != literal_column("'deleted'")
+IS_DELETED = users.c.status == literal_column("'deleted'")
+IS_DEACTIVATED = users.c.status == literal_column("'deactivated'")
+
+
+# Read-only projection of a user row. Built from a Core select, so it skips
+# the identity map, attribute instrumentation and @validates hooks
+@dataclass(slots=True, frozen=True)
+class UserProfile:
+    id: UUID
+    updated_at: datetime.datetime
+    name: str
+    username: str
+    profile_picture: Optional[str]
+    bio: Optional[str]
+    is_private: bool
+
+
+USER_PROFILE_COLUMNS = (
+    users.c.id,
+    users.c.updated_at,
+    users.c.name,
+    users.c.username,
+    users.c.profile_picture,
+    users.c.bio,
+    users.c.is_private,
+)
 
 
 async def create_user(
@@ -18,7 +58,9 @@ async def create_user(
     try:
         # Check if user already exists
         existing_user_query = await db.execute(
-            select(User.id).where((User.email == email) | (User.username == username))
+            select(User.id).where(
+                (User.email == email) | (User.username == username), IS_LIVE
+            )
         )
         if existing_user_query.scalar_one_or_none():
             raise Exception("User with this email or username already exists")
@@ -42,6 +84,42 @@ async def create_user(
         raise e
 
 
+async def get_user_status(
+    db: AsyncSession,
+    email: Optional[EmailStr] = None,
+    username: Optional[str] = None,
+):
+    # Status of the live account with this email or username, None if there
+    # is none. Deactivated accounts are hidden from profile lookups but still
+    # own their email and username, so sign-up must not offer them
+    if email is not None:
+        criteria = users.c.email == email
+    elif username is not None:
+        criteria = users.c.username == username
+    else:
+        raise ValueError("An email or username is required")
+
+    connection = await db.connection()
+    result = await connection.execute(select(users.c.status).where(criteria, IS_LIVE))
+    return result.scalar_one_or_none()
+
+
+async def reactivate_user(db: AsyncSession, email: EmailStr):
+    # Signing in to a deactivated account restores it
+    try:
+        result = await db.execute(
+            update(User)
+            .where(User.email == email, IS_DEACTIVATED)
+            .values(status=UserStatus.active)
+        )
+        await db.commit()
+        return result.rowcount > 0
+
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+
 async def get_user(
     db: AsyncSession,
     id: Optional[UUID] = None,
@@ -54,7 +132,8 @@ async def get_user(
                 User.id == id,
                 User.email == email,
                 User.username == username,
-            )
+            ),
+            IS_ACTIVE,
         )
     )
     user = user_query.scalar_one_or_none()
@@ -62,3 +141,144 @@ async def get_user(
         raise Exception(f"User not found (id:{id}, email:{email}, username:{username})")
 
     return user
+
+
+def user_profile_query(
+    id: Optional[UUID] = None,
+    email: Optional[EmailStr] = None,
+    username: Optional[str] = None,
+):
+    if id is not None:
+        criteria = users.c.id == id
+    elif email is not None:
+        criteria = users.c.email == email
+    elif username is not None:
+        criteria = users.c.username == username
+    else:
+        raise ValueError("A user id, email or username is required")
+
+    return select(*USER_PROFILE_COLUMNS).where(criteria, IS_ACTIVE)
+
+
+async def get_user_profile(
+    db: AsyncSession,
+    id: Optional[UUID] = None,
+    email: Optional[EmailStr] = None,
+    username: Optional[str] = None,
+):
+    connection = await db.connection()
+    result = await connection.execute(user_profile_query(id, email, username))
+    row = result.first()
+    if not row:
+        raise Exception(f"User not found (id:{id}, email:{email}, username:{username})")
+
+    return UserProfile(*row)
+
+
+stale_profiles: StaleCache[UserProfile] = StaleCache(
+    "user_profile", get_settings().stale_cache_size
+)
+
+
+async def load_current_user(db: AsyncSession, id: UUID):
+    # Resolves the user of every authenticated request. While Postgres is
+    # unavailable, the last profile this worker saw keeps sessions working
+    async def load():
+        try:
+            return await get_user_profile(db, id=id)
+        except Exception:
+            await db.rollback()
+            raise
+
+    try:
+        user = await retry(load, is_database_unavailable)
+    except Exception as e:
+        stale = stale_profiles.get(id) if is_database_unavailable(e) else None
+        if stale is None:
+            raise
+        return stale
+
+    stale_profiles.set(id, user)
+    return user
+
+
+@dataclass(slots=True, frozen=True)
+class UserCounts:
+    updated_at: Optional[datetime.datetime]
+    posts_count: int
+    followers_count: int
+    following_count: int
+
+
+def user_page_query(username: str):
+    # Profile and counters in one lookup: username index + user_stats primary key
+    stats = UserStats.__table__
+    return (
+        user_profile_query(username=username)
+        .add_columns(
+            stats.c.updated_at,
+            stats.c.posts_count,
+            stats.c.followers_count,
+            stats.c.following_count,
+        )
+        .outerjoin(stats, stats.c.user_id == users.c.id)
+    )
+
+
+async def get_user_page(db: AsyncSession, username: str):
+    connection = await db.connection()
+    result = await connection.execute(user_page_query(username))
+    row = result.first()
+    if not row:
+        raise Exception(f"User not found (username:{username})")
+
+    profile_size = len(USER_PROFILE_COLUMNS)
+    updated_at, posts, followers, following = row[profile_size:]
+    return UserProfile(*row[:profile_size]), UserCounts(
+        updated_at,
+        posts or 0,
+        followers or 0,
+        following or 0,
+    )
+
+
+def encode_user_page(page: tuple[UserProfile, UserCounts]):
+    return orjson.dumps(page)
+
+
+def decode_user_page(data: bytes):
+    profile, counts = orjson.loads(data)
+    profile["id"] = UUID(profile["id"])
+    profile["updated_at"] = datetime.datetime.fromisoformat(profile["updated_at"])
+    if counts["updated_at"] is not None:
+        counts["updated_at"] = datetime.datetime.fromisoformat(counts["updated_at"])
+    return UserProfile(**profile), UserCounts(**counts)
+
+
+user_page_flight = SharedSingleFlight("user_page", encode_user_page, decode_user_page)
+
+stale_user_pages: StaleCache[tuple[UserProfile, UserCounts]] = StaleCache(
+    "user_page", get_settings().stale_cache_size
+)
+
+
+async def load_user_page(username: str, primary: bool = False):
+    # Concurrent reads of the same (often freshly shared) profile share a
+    # single query. The lookup uses its own session, since it may outlive
+    # the request that started it
+    async def load():
+        async with read_session(primary) as db:
+            return await get_user_page(db, username)
+
+    try:
+        page = await user_page_flight.do(
+            (username, primary), lambda: retry(load, is_database_unavailable)
+        )
+    except Exception as e:
+        stale = stale_user_pages.get(username) if is_database_unavailable(e) else None
+        if stale is None:
+            raise
+        return stale
+
+    stale_user_pages.set(username, page)
+    return page
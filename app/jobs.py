@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+import redis
+import redis.asyncio
+
+from app.cache import async_r
+from app.config import get_settings
+
+# Durable jobs on Redis Streams. API workers only enqueue; `python -m
+# app.worker` consumes. Each queue is a stream read by one consumer group,
+# failed jobs wait in a sorted set until their retry is due, and jobs that
+# run out of attempts land in a dead-letter stream. Keys of one queue share
+# a hash tag, so every script below touches a single cluster slot
+
+GROUP = "workers"
+
+# Drops the job when its id was enqueued within the dedupe window
+ENQUEUE = """
+if not redis.call('SET', KEYS[2], 1, 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'job', ARGV[3])
+return 1
+"""
+
+# Moves retries that are due back onto the stream
+PROMOTE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('XADD', KEYS[2], '*', 'job', job)
+    redis.call('ZREM', KEYS[1], job)
+end
+return #due
+"""
+
+
+def stream_key(queue: str):
+    return f"jobs:{{{queue}}}"
+
+
+def delayed_key(queue: str):
+    return f"jobs:{{{queue}}}:delayed"
+
+
+def dead_key(queue: str):
+    return f"jobs:{{{queue}}}:dead"
+
+
+def job_id_key(queue: str, job_id: str):
+    return f"jobs:{{{queue}}}:id:{job_id}"
+
+
+@dataclass(slots=True)
+class Job:
+    id: str
+    name: str
+    kwargs: dict[str, Any]
+    attempts: int = 0
+
+
+@dataclass(slots=True, frozen=True)
+class JobType:
+    name: str
+    queue: str
+    function: Callable[..., Awaitable[Any]] = field(compare=False)
+
+    async def enqueue(self, job_id: Optional[str] = None, **kwargs: Any):
+        # Returns False when a job with the same id was already enqueued
+        settings = get_settings()
+        job = Job(job_id or os.urandom(16).hex(), self.name, kwargs)
+        return bool(
+            await async_r.eval(
+                ENQUEUE,
+                2,
+                stream_key(self.queue),
+                job_id_key(self.queue, job.id),
+                settings.job_dedupe_ttl_seconds,
+                settings.job_stream_max_length,
+                orjson.dumps(job),
+            )
+        )
+
+
+job_types: dict[str, JobType] = {}
+
+
+def job(queue: str = "default"):
+    # Registers an async function as a job. Arguments must be JSON values
+    def register(function: Callable[..., Awaitable[Any]]):
+        job_type = JobType(
+            f"{function.__module__}.{function.__qualname__}", queue, function
+        )
+        job_types[job_type.name] = job_type
+        return job_type
+
+    return register
+
+
+def retry_delay(attempts: int):
+    base = get_settings().job_retry_base_delay_seconds
+    return base * 2 ** (attempts - 1) * random.uniform(0.5, 1)
+
+
+class JobWorker:
+    def __init__(self, client: redis.asyncio.Redis, queues: dict[str, int]):
+        self.client = client
+        self.queues = queues
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        # Cluster pipelines cannot MULTI. A queue's keys share a hash tag, so
+        # its pipelines still reach one node in one round trip
+        self.transaction = not get_settings().redis_cluster
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        for queue in self.queues:
+            try:
+                await self.client.xgroup_create(
+                    stream_key(queue), GROUP, id="0", mkstream=True
+                )
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+        # Per-queue concurrency: one consumer loop per slot, each running
+        # one job at a time
+        tasks = [
+            asyncio.create_task(self._consume(queue))
+            for queue, concurrency in self.queues.items()
+            for _ in range(concurrency)
+        ]
+        tasks.append(asyncio.create_task(self._maintain()))
+        logging.info(f"Job worker {self.consumer} consuming {self.queues}")
+
+        # In-flight jobs finish; blocked reads return within job_block_ms
+        await asyncio.gather(*tasks)
+
+    async def _consume(self, queue: str):
+        settings = get_settings()
+        while not self._stopping.is_set():
+            try:
+                entries = await self.client.xreadgroup(
+                    GROUP,
+                    self.consumer,
+                    {stream_key(queue): ">"},
+                    count=1,
+                    block=settings.job_block_ms,
+                )
+                for _, messages in entries or []:
+                    for message_id, fields in messages:
+                        await self.process(queue, message_id, fields)
+            except redis.RedisError as e:
+                logging.error(f"Job queue {queue} unavailable: {str(e)}")
+                await asyncio.sleep(1)
+            except Exception as e:
+                # The entry stays pending and is reclaimed as a failed
+                # attempt; this consumer keeps going
+                logging.error(f"Job queue {queue} consumer error: {str(e)}")
+
+    async def decode(self, queue: str, message_id: str, fields: dict):
+        # Entries that are not a job are dead-lettered as they are
+        try:
+            return Job(**orjson.loads(fields["job"]))
+        except Exception as e:
+            logging.error(f"Malformed job {message_id} in {queue}: {str(e)}")
+            pipe = self.client.pipeline(transaction=self.transaction)
+            pipe.xadd(
+                dead_key(queue),
+                {**fields, "error": f"Malformed job: {e!r}"},
+                maxlen=get_settings().job_stream_max_length,
+                approximate=True,
+            )
+            pipe.xack(stream_key(queue), GROUP, message_id)
+            pipe.xdel(stream_key(queue), message_id)
+            await pipe.execute()
+            return None
+
+    async def process(self, queue: str, message_id: str, fields: dict):
+        job = await self.decode(queue, message_id, fields)
+        if job is None:
+            return
+        job_type = job_types.get(job.name)
+        if job_type is None:
+            await self.fail(queue, message_id, job, f"Unknown job {job.name}", True)
+            return
+
+        start_time = time.perf_counter()
+        try:
+            async with asyncio.timeout(get_settings().job_timeout_seconds):
+                await job_type.function(**job.kwargs)
+        except Exception as e:
+            logging.error(f"Job {job.name} ({job.id}) failed: {str(e)}")
+            await self.fail(queue, message_id, job, repr(e))
+            return
+
+        pipe = self.client.pipeline(transaction=self.transaction)
+        pipe.xack(stream_key(queue), GROUP, message_id)
+        pipe.xdel(stream_key(queue), message_id)
+        await pipe.execute()
+        logging.info(
+            f"Job {job.name} ({job.id}) done in {time.perf_counter() - start_time:.3f}s"
+        )
+
+    async def fail(
+        self,
+        queue: str,
+        message_id: str,
+        job: Job,
+        error: str,
+        permanent: bool = False,
+    ):
+        job.attempts += 1
+        pipe = self.client.pipeline(transaction=self.transaction)
+        if permanent or job.attempts >= get_settings().job_max_attempts:
+            pipe.xadd(
+                dead_key(queue),
+                {"job": orjson.dumps(job), "error": error},
+                maxlen=get_settings().job_stream_max_length,
+                approximate=True,
+            )
+        else:
+            pipe.zadd(
+                delayed_key(queue),
+                {orjson.dumps(job): time.time() + retry_delay(job.attempts)},
+            )
+        pipe.xack(stream_key(queue), GROUP, message_id)
+        pipe.xdel(stream_key(queue), message_id)
+        await pipe.execute()
+
+    async def _maintain(self):
+        settings = get_settings()
+        while not self._stopping.is_set():
+            for queue in self.queues:
+                try:
+                    await self.client.eval(
+                        PROMOTE_DUE,
+                        2,
+                        delayed_key(queue),
+                        stream_key(queue),
+                        time.time(),
+                        100,
+                    )
+                    await self._reclaim(queue)
+                except Exception as e:
+                    logging.error(f"Job queue {queue} maintenance failed: {str(e)}")
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), settings.job_maintenance_interval_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reclaim(self, queue: str):
+        # Jobs left pending by a worker that died count as a failed attempt
+        claimed = await self.client.xautoclaim(
+            stream_key(queue),
+            GROUP,
+            self.consumer,
+            min_idle_time=get_settings().job_visibility_timeout_seconds * 1000,
+            count=100,
+        )
+        for message_id, fields in claimed[1]:
+            if fields:
+                job = await self.decode(queue, message_id, fields)
+                if job is not None:
+                    await self.fail(queue, message_id, job, "Worker lost")
@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional
+
+import orjson
+from jwt import get_algorithm_by_name
+from jwt.algorithms import HMACAlgorithm
+
+from app.config import get_settings
+
+
+@dataclass(slots=True, frozen=True)
+class VerificationKey:
+    key: Any
+    algorithm: str
+
+
+@dataclass(slots=True, frozen=True)
+class KeyRing:
+    # Parsed once per worker; signing and verification never touch PEM again
+    algorithm: str
+    signing_key: Any
+    kid: Optional[str]
+    verification_keys: dict[Optional[str], VerificationKey]
+    jwks: bytes
+
+
+@lru_cache
+def get_keyring():
+    settings = get_settings()
+    algorithm = get_algorithm_by_name(settings.jwt_algorithm)
+
+    if isinstance(algorithm, HMACAlgorithm):
+        return KeyRing(
+            settings.jwt_algorithm,
+            settings.jwt_secret_key,
+            None,
+            {None: VerificationKey(settings.jwt_secret_key, settings.jwt_algorithm)},
+            orjson.dumps({"keys": []}),
+        )
+
+    verification_keys: dict[Optional[str], VerificationKey] = {}
+
+    # Tokens without a kid were signed with the shared secret, using the
+    # algorithm configured before the switch. They stay verifiable while a
+    # deployment migrates to asymmetric keys
+    if settings.jwt_secret_key:
+        verification_keys[None] = VerificationKey(
+            settings.jwt_secret_key, settings.jwt_legacy_algorithm
+        )
+
+    if not settings.jwt_private_key or not settings.jwt_key_id:
+        raise ValueError(f"{settings.jwt_algorithm} requires a private key and key id")
+
+    signing_key = algorithm.prepare_key(settings.jwt_private_key)
+    public_keys = {settings.jwt_key_id: signing_key.public_key()}
+    # Previous (or upcoming) keys: published and accepted, never used to sign
+    for kid, pem in settings.jwt_verification_keys.items():
+        public_keys.setdefault(kid, algorithm.prepare_key(pem))
+
+    jwks = []
+    for kid, public_key in public_keys.items():
+        verification_keys[kid] = VerificationKey(public_key, settings.jwt_algorithm)
+        jwk = algorithm.to_jwk(public_key, as_dict=True)
+        jwks.append({**jwk, "kid": kid, "alg": settings.jwt_algorithm, "use": "sig"})
+
+    return KeyRing(
+        settings.jwt_algorithm,
+        signing_key,
+        settings.jwt_key_id,
+        verification_keys,
+        orjson.dumps({"keys": jwks}),
+    )
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from app.config import get_settings
+from app.metrics import Counter, Histogram
+
+# Loop health. A coroutine wakes up every interval and records how late it
+# was scheduled (lag). A watchdog thread notices when those wake-ups stop:
+# the loop is then stuck in one callback, so the loop thread's current
+# stack is the blocking call. Costs one wake-up per interval per worker
+
+loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between a scheduled event loop wake-up and when it ran",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+blocking_calls = Counter(
+    "event_loop_blocking_calls_total",
+    "Callbacks that held the event loop longer than the threshold, by route",
+)
+
+
+def describe_route(frame):
+    # The innermost ASGI scope on the stack names the request being served
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+            route = scope.get("route")
+            path = getattr(route, "path", scope.get("path"))
+            return f"{scope.get('method', 'WEBSOCKET')} {path}"
+        frame = frame.f_back
+    return "background"
+
+
+class LoopMonitor:
+    def __init__(self):
+        settings = get_settings()
+        self.interval = settings.loop_monitor_interval_ms / 1000
+        self.threshold = settings.loop_block_threshold_ms / 1000
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._thread = None
+
+    async def _measure(self):
+        while True:
+            scheduled = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            loop_lag.observe(max(now - scheduled, 0))
+            self._heartbeat = now
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or heartbeat == reported:
+                continue
+
+            # One report per stall, taken while the loop is still blocked
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            route = describe_route(frame)
+            blocking_calls.inc(route=route)
+            logging.warning(
+                f"Event loop blocked for over {blocked * 1000:.0f} ms "
+                f"in {route}:\n{''.join(traceback.format_stack(frame))}"
+            )
+
+
+loop_monitor = LoopMonitor()
@@ -1,3 +1,4 @@
+import asyncio
 import time
 from contextlib import asynccontextmanager
 from typing import Awaitable, Callable
@@ -6,9 +7,31 @@ from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import ORJSONResponse
+from fastapi.staticfiles import StaticFiles
 
+from app.admission import AdmissionMiddleware
 from app.config import get_settings
-from app.routers import auth, users
+from app.database import replicas
+from app.idempotency import IdempotencyMiddleware
+from app.internal.images import shutdown_executor
+from app.internal.purge import run_user_purger
+from app.internal.realtime import hub
+from app.internal.stats import run_stats_reconciler
+from app.loop_monitor import loop_monitor
+from app.profiling import ProfilingMiddleware
+from app.resilience import CircuitOpenError, service_unavailable
+from app.routers import (
+    admin,
+    auth,
+    health,
+    media,
+    metrics,
+    realtime,
+    users,
+    well_known,
+)
+from app.storage import LocalStorage, get_storage
+from app.warmup import warmup
 
 
 @asynccontextmanager
@@ -17,8 +40,23 @@ async def lifespan(app: FastAPI):
 
     # await drop_and_create_tables()
 
+    if get_settings().loop_monitor_enabled:
+        loop_monitor.start()
+    hub.start()
+    replicas.start()
+    stats_reconciler = asyncio.create_task(run_stats_reconciler())
+    user_purger = asyncio.create_task(run_user_purger())
+    await warmup.run()
+
     yield
 
+    stats_reconciler.cancel()
+    user_purger.cancel()
+    await hub.stop()
+    await replicas.stop()
+    shutdown_executor()
+    await loop_monitor.stop()
+
 
 app = FastAPI(
     title="Connector API",
@@ -40,6 +78,20 @@ else:
         "https://127.0.0.1:3000",
     ]
 
+# Sheds load before it queues on the database pool. Inside CORS, so browsers
+# can read the 503 and its Retry-After
+if get_settings().admission_enabled:
+    app.add_middleware(AdmissionMiddleware)
+
+# Mobile clients retry these on flaky networks. Inside CORS, so replayed
+# responses get the headers of the request they answer. Outside admission:
+# only the request that runs takes a slot, duplicates waiting for it do not
+# hold one or count towards its latency
+app.add_middleware(
+    IdempotencyMiddleware,
+    paths=("/auth/login/email", "/auth/verify/email"),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -57,6 +109,10 @@ if get_settings().environment == "production":
     )
 
 
+if get_settings().profiling_secret:
+    app.add_middleware(ProfilingMiddleware)
+
+
 @app.middleware("http")
 async def add_process_time_header(
     request: Request,
@@ -69,6 +125,17 @@ async def add_process_time_header(
     return response
 
 
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, e: CircuitOpenError):
+    # Fail-fast errors that no handler turned into a degraded response
+    exception = service_unavailable(e)
+    return ORJSONResponse(
+        {"detail": exception.detail},
+        status_code=exception.status_code,
+        headers=exception.headers,
+    )
+
+
 # @app.middleware("http")
 # async def add_security_headers(
 #     request: Request,
@@ -127,3 +194,16 @@ async def add_process_time_header(
 
 app.include_router(auth.router)
 app.include_router(users.router)
+app.include_router(realtime.router)
+app.include_router(media.router)
+app.include_router(metrics.router)
+app.include_router(well_known.router)
+app.include_router(admin.router)
+app.include_router(health.router)
+
+if isinstance(get_storage(), LocalStorage):
+    app.mount(
+        get_settings().media_base_url,
+        StaticFiles(directory=get_storage().root),
+        name="media",
+    )
@@ -0,0 +1,115 @@
+import bisect
+import os
+from typing import Callable, Optional
+
+# Minimal per-worker metrics rendered in the Prometheus text format. Each
+# sample carries the worker pid, since every worker keeps its own values
+
+
+def format_labels(labels: tuple[tuple[str, str], ...]):
+    labels = (("pid", str(os.getpid())),) + labels
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        registry.append(self)
+
+    def samples(self) -> list[str]:
+        return []
+
+    def render(self):
+        return "\n".join(
+            [
+                f"# HELP {self.name} {self.description}",
+                f"# TYPE {self.name} {self.type}",
+                *self.samples(),
+            ]
+        )
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [
+            f"{self.name}{format_labels(key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    # Gauges are read when rendered, so they never go stale
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        collect: Callable[[], dict[tuple, float]],
+    ):
+        super().__init__(name, description)
+        self.collect = collect
+
+    def samples(self):
+        return [
+            f"{self.name}{format_labels(key)} {value}"
+            for key, value in self.collect().items()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...]):
+        super().__init__(name, description)
+        self.buckets = buckets
+        self._values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        counts, total = self._values.setdefault(
+            key, ([0] * (len(self.buckets) + 1), [0.0])
+        )
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self):
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(
+                    f"{self.name}_bucket{format_labels(key + (('le', le),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{format_labels(key)} {total[0]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return lines
+
+
+registry: list[Metric] = []
+
+
+def render_metrics(names: Optional[set[str]] = None):
+    return (
+        "\n".join(
+            metric.render()
+            for metric in registry
+            if names is None or metric.name in names
+        )
+        + "\n"
+    )
@@ -5,7 +5,18 @@ import string
 import uuid
 from typing import List, Optional
 
-from sqlalchemy import ARRAY, UUID, Boolean, DateTime, Enum, ForeignKey, Integer, String
+from sqlalchemy import (
+    ARRAY,
+    UUID,
+    Boolean,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    text,
+)
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import (
     DeclarativeBase,
@@ -54,20 +65,11 @@ class User(Base):
     updated_at: Mapped[datetime.datetime] = mapped_column(
         DateTime(timezone=True),
         insert_default=lambda: datetime.datetime.now(datetime.timezone.utc),
+        onupdate=lambda: datetime.datetime.now(datetime.timezone.utc),
     )
 
-    email: Mapped[str] = mapped_column(
-        String,
-        unique=True,
-        index=True,
-        nullable=False,
-    )
-    username: Mapped[str] = mapped_column(
-        String(30),
-        unique=True,
-        index=True,
-        nullable=False,
-    )
+    email: Mapped[str] = mapped_column(String, nullable=False)
+    username: Mapped[str] = mapped_column(String(30), nullable=False)
     name: Mapped[str] = mapped_column(String, nullable=False)
     gender: Mapped[Optional[UserGender]] = mapped_column(
         Enum(UserGender), default=UserGender.prefer_not_to_say
@@ -87,6 +89,29 @@ class User(Base):
         back_populates="user", cascade="all, delete-orphan"
     )
 
+    # Uniqueness only covers accounts that are not deleted, so a deleted
+    # account frees its email and username and dead rows stay out of the
+    # lookup indexes. Predicates are literals so queries can match them
+    __table_args__ = (
+        Index(
+            "ix_users_email_live",
+            "email",
+            unique=True,
+            postgresql_where=text("status <> 'deleted'"),
+        ),
+        Index(
+            "ix_users_username_live",
+            "username",
+            unique=True,
+            postgresql_where=text("status <> 'deleted'"),
+        ),
+        Index(
+            "ix_users_deleted_updated_at",
+            "updated_at",
+            postgresql_where=text("status = 'deleted'"),
+        ),
+    )
+
     @validates("email")
     def validate_email(self, key, email):
         return email_validator(email)
@@ -151,5 +176,87 @@ class Post(Base):
     likes: Mapped[int] = mapped_column(Integer, default=0)
     is_edited: Mapped[bool] = mapped_column(Boolean, default=False)
 
-    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"))
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), index=True)
     user: Mapped["User"] = relationship(back_populates="posts")
+
+
+class Follow(Base):
+    __tablename__ = "follows"
+
+    follower_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    followee_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True),
+        insert_default=lambda: datetime.datetime.now(datetime.timezone.utc),
+    )
+
+    # The primary key answers "does A follow B"; these serve the newest-first
+    # keyset pagination of both adjacency lists
+    __table_args__ = (
+        Index(
+            "ix_follows_follower_id_created_at",
+            "follower_id",
+            "created_at",
+            "followee_id",
+        ),
+        Index(
+            "ix_follows_followee_id_created_at",
+            "followee_id",
+            "created_at",
+            "follower_id",
+        ),
+    )
+
+
+class FollowRequest(Base):
+    __tablename__ = "follow_requests"
+
+    # Pending follows of private accounts; approval moves them to follows,
+    # which only holds follows that grant access
+    follower_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    followee_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True),
+        insert_default=lambda: datetime.datetime.now(datetime.timezone.utc),
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_follow_requests_followee_id_created_at",
+            "followee_id",
+            "created_at",
+            "follower_id",
+        ),
+    )
+
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    # Denormalized counters, updated in the same transaction as the
+    # underlying write and periodically reconciled against the source tables
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True),
+        insert_default=lambda: datetime.datetime.now(datetime.timezone.utc),
+        onupdate=lambda: datetime.datetime.now(datetime.timezone.utc),
+    )
+
+    posts_count: Mapped[int] = mapped_column(Integer, default=0)
+    followers_count: Mapped[int] = mapped_column(Integer, default=0)
+    following_count: Mapped[int] = mapped_column(Integer, default=0)
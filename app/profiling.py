@@ -0,0 +1,140 @@
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.cache import async_r
+from app.config import get_settings
+
+# On-demand sampling profiler. A background thread samples the event loop
+# thread's stack every few milliseconds and aggregates the samples in the
+# collapsed format read by flamegraph.pl, speedscope and inferno. Nothing
+# runs unless a profile is requested: the middleware is only installed when
+# PROFILING_SECRET is set, and then costs one header lookup per request.
+# Samples show whatever the loop runs, so concurrent requests appear too
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+
+def sign_profile_token(expires: int):
+    secret = get_settings().profiling_secret.encode()
+    signature = hmac.new(secret, str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify_profile_token(token: str):
+    if not get_settings().profiling_secret:
+        return False
+    expires, _, _ = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(token, sign_profile_token(int(expires)))
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    # One profile at a time per process, so concurrent triggers cannot
+    # multiply the sampling cost
+    _lock = threading.Lock()
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or get_settings().profiling_interval_ms / 1000
+        self.thread_id = threading.get_ident()
+        self.samples: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if not SamplingProfiler._lock.acquire(blocking=False):
+            return False
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            SamplingProfiler._lock.release()
+        return self.collapsed()
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.items())
+
+
+async def store_profile(profile_id: str, collapsed: str):
+    await async_r.set(
+        f"profile:{profile_id}",
+        collapsed,
+        ex=get_settings().profiling_result_ttl_seconds,
+    )
+
+
+async def load_profile(profile_id: str) -> Optional[str]:
+    return await async_r.get(f"profile:{profile_id}")
+
+
+class ProfilingMiddleware:
+    # Profiles one request carrying a valid signed X-Profile header. The
+    # response gets an X-Profile-Id; the collapsed stacks are stored under
+    # it once the response is complete, see GET /admin/profiles/{id}
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Admin endpoints carry the same token to authorize themselves
+        if scope["type"] != "http" or scope["path"].startswith("/admin/"):
+            return await self.app(scope, receive, send)
+
+        token = next(
+            (
+                value.decode()
+                for name, value in scope["headers"]
+                if name == PROFILE_HEADER
+            ),
+            None,
+        )
+        if token is None or not verify_profile_token(token):
+            return await self.app(scope, receive, send)
+
+        profiler = SamplingProfiler()
+        if not profiler.start():
+            return await self.app(scope, receive, send)
+
+        profile_id = os.urandom(8).hex()
+
+        async def send_with_profile_id(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (PROFILE_ID_HEADER, profile_id.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            await store_profile(profile_id, profiler.stop())
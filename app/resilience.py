@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+from fastapi import HTTPException, status
+
+from app.config import get_settings
+from app.metrics import Counter, Gauge
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit breaker {name} is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    # Closed: calls pass and consecutive failures are counted. Open: calls
+    # fail immediately until the reset timeout. Half-open: one trial call
+    # per reset period; its success closes the breaker, its failure reopens it
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+        error: type[CircuitOpenError] = CircuitOpenError,
+    ):
+        settings = get_settings()
+        self.name = name
+        # Raised when open; a subclass per backend tells callers which one
+        self.error = error
+        self.failure_threshold = failure_threshold or settings.breaker_failure_threshold
+        self.reset_timeout = reset_timeout or settings.breaker_reset_timeout_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self._next_attempt = 0.0
+        breakers.append(self)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logging.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+            breaker_transitions.inc(breaker=self.name, state=state)
+            self.state = state
+
+    def before_call(self):
+        if self.state == CLOSED:
+            return
+        now = time.monotonic()
+        if now < self._next_attempt:
+            breaker_rejections.inc(breaker=self.name)
+            raise self.error(self.name, self._next_attempt - now)
+        self._set_state(HALF_OPEN)
+        self._next_attempt = now + self.reset_timeout
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._set_state(OPEN)
+            self._next_attempt = time.monotonic() + self.reset_timeout
+
+    @contextmanager
+    def guard(self, is_failure: Callable[[BaseException], bool]):
+        # Errors that are not failures (e.g. a rejected command) still prove
+        # the backend is answering, so they count as successes
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            if is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+
+
+breakers: list[CircuitBreaker] = []
+
+breaker_state = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+    lambda: {
+        (("breaker", breaker.name),): STATE_VALUES[breaker.state]
+        for breaker in breakers
+    },
+)
+breaker_transitions = Counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker state changes by breaker and new state",
+)
+breaker_rejections = Counter(
+    "circuit_breaker_rejections_total",
+    "Calls failed fast by an open circuit breaker",
+)
+degraded_responses = Counter(
+    "degraded_responses_total",
+    "Lookups answered from a stale copy while a backend was unavailable",
+)
+
+
+def backoff_delay(attempt: int):
+    # Full jitter: concurrent retries spread out instead of arriving together
+    return random.uniform(0, get_settings().retry_base_delay_seconds * 2**attempt)
+
+
+async def retry(
+    function: Callable[[], Awaitable[T]],
+    is_transient: Callable[[BaseException], bool],
+    attempts: Optional[int] = None,
+) -> T:
+    # Only for idempotent reads. An open breaker is never retried
+    attempts = attempts or get_settings().retry_attempts
+    for attempt in range(attempts):
+        try:
+            return await function()
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            if attempt + 1 >= attempts or not is_transient(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+    raise AssertionError("unreachable")
+
+
+def service_unavailable(e: BaseException):
+    retry_after = (
+        e.retry_after
+        if isinstance(e, CircuitOpenError)
+        else get_settings().breaker_reset_timeout_seconds
+    )
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Service temporarily unavailable",
+        headers={"Retry-After": str(max(1, round(retry_after)))},
+    )
+
+
+class StaleCache(Generic[T]):
+    # Last known good values, only served while the backing store is down
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[T]:
+        value = self._entries.get(key)
+        if value is not None:
+            degraded_responses.inc(cache=self.name)
+        return value
+
+    def set(self, key: Hashable, value: T):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
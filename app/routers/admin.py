@@ -0,0 +1,52 @@
+import asyncio
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.config import get_settings
+from app.profiling import SamplingProfiler, load_profile, verify_profile_token
+
+# Operational endpoints, authorized by the signed token from
+# `python -m app.cli profile-token` in the X-Profile header
+
+
+def verify_admin(x_profile: Annotated[str, Header()] = ""):
+    if not verify_profile_token(x_profile):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(verify_admin)],
+    include_in_schema=False,
+)
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile_window(
+    seconds: float = Query(default=10, gt=0, le=get_settings().profiling_max_seconds),
+):
+    # Profiles the worker process that receives this request
+    profiler = SamplingProfiler()
+    if not profiler.start():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running in this worker",
+        )
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        collapsed = profiler.stop()
+    return PlainTextResponse(collapsed)
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def read_profile(profile_id: str):
+    collapsed = await load_profile(profile_id)
+    if collapsed is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    return PlainTextResponse(collapsed)
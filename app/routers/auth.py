@@ -1,29 +1,36 @@
+import hashlib
 import logging
-from datetime import datetime, timezone
+from dataclasses import dataclass
 from typing import Optional
 
-import resend
-import resend.exceptions
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
     Depends,
     HTTPException,
     Request,
-    Response,
     status,
 )
+from fastapi.responses import ORJSONResponse
 from pydantic import (
     BaseModel,
     EmailStr,
 )
 
-from app.cache import RedisDep
+from app.cache import AsyncRedisDep
 from app.config import get_settings
-from app.database import SessionDep
-from app.dependencies import read_current_user
-from app.internal.users import create_user, get_user
-from app.models import User, UserGender
+from app.database import ReadSessionDep, SessionDep, mark_recent_write
+from app.dependencies import is_backend_unavailable, read_current_user
+from app.http_cache import cached_json_response
+from app.internal.emails import send_verification_email
+from app.internal.users import (
+    UserProfile,
+    create_user,
+    get_user_profile,
+    get_user_status,
+    reactivate_user,
+)
+from app.models import UserGender
+from app.resilience import service_unavailable
 from app.token import (
     create_access_token,
     create_login_token,
@@ -41,51 +48,50 @@ from app.validators import username_validator
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-resend.api_key = get_settings().resend_api_key
+# Responses are slotted dataclasses returned through ORJSONResponse, which
+# serializes them natively. Returning a Response skips FastAPI's
+# validation and jsonable_encoder pass; response_model still documents them.
 
 
-def generate_email_html(
-    origin: str,
-    code: str,
-    token: str,
-    is_new_user: bool,
-    expiry_minutes: int,
-):
-    login_url = f"{origin}/login?token={token}&is-new-user={is_new_user}"
-    current_year = datetime.now(timezone.utc).year
+@dataclass(slots=True)
+class LoginResponse:
+    login_token: str
+    is_new_user: bool
 
-    return f"""<body style="background-color: white"> <table align="center" width="100%" border="0" cellpadding="0" cellspacing="0" role="presentation" style=" max-width: 37.5em; padding-left: 12px; padding-right: 12px; margin: 0 auto; " > <tbody> <tr style="width: 100%"> <td> <h1 style=" color: black; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; font-size: 24px; font-weight: bold; margin: 40px 0; padding: 0; " > Log in to Connector </h1> <p style=" font-size: 14px; line-height: 24px; margin-bottom: 14px; margin-top: 16px; color: black; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; margin: 24px 0; " > To complete the log in process; enter the verification code in the original window, or enter it in a new one by going to the link below: </p> <code style=" display: inline-block; padding: 16px 4.5%; width: 90.5%; background-color: #f5f5f5; border-radius: 5px; border: 1px; color: black; " >{code}</code > <a href="{login_url}" style=" color: #216fdb; text-decoration-line: none; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; font-size: 14px; text-decoration: underline; display: block; margin: 24px 0; " target="_blank" >{login_url}</a > <p style=" font-size: 14px; line-height: 24px; color: black; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; margin: 24px 0; " > This link and code will only be valid for the next {expiry_minutes} minutes. </p> <p style=" font-size: 14px; line-height: 24px; color: #999999; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; margin: 24px 0; " > If you didn't try to log in, you can safely ignore this email. </p> <hr style="width: 100%; border: none; border-top: 1px solid #e5e5e5" /> <p style=" font-size: 14px; line-height: 22px; color: #999999; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif; margin: 24px 0; " > © {current_year} Connector Inc. </p> </td> </tr> </tbody> </table> </body>"""
 
+@dataclass(slots=True)
+class UsernameAvailabilityResponse:
+    available: bool
+    error: Optional[str] = None
 
-async def send_verification_email(
-    origin: str,
-    to_email: str,
-    code: str,
-    token: str,
-    is_new_user: bool,
-):
-    try:
-        html = generate_email_html(
-            origin,
-            code,
-            token,
-            is_new_user,
-            get_settings().verification_email_expiry_minutes,
-        )
 
-        params: resend.Emails.SendParams = {
-            "from": f"Connector <{get_settings().sender_email}>",
-            "to": [to_email],
-            "subject": f"{code} - Log in to Connector ",
-            "html": html,
-        }
+@dataclass(slots=True)
+class TokenResponse:
+    access_token: str
+    token_type: str = "bearer"
 
-        resend.Emails.send(params)
-    except resend.exceptions.ResendError:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Email sending failed",
-        )
+
+@dataclass(slots=True)
+class MessageResponse:
+    message: str
+
+
+@dataclass(slots=True)
+class AuthUserResponse:
+    name: str
+    username: str
+    profile_picture: Optional[str]
+
+
+def set_refresh_token_cookie(response: ORJSONResponse, refresh_token: str):
+    response.set_cookie(
+        "refresh_token",
+        refresh_token,
+        httponly=True,
+        secure=True,
+        samesite="strict",
+        expires=get_settings().refresh_token_expiry_days * 24 * 60 * 60,
+    )
 
 
 class LoginRequestBody(BaseModel):
@@ -94,43 +100,44 @@ class LoginRequestBody(BaseModel):
 
 @router.post(
     "/login/email",
+    response_model=LoginResponse,
     responses={status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"}},
 )
 async def login_with_email(
     body: LoginRequestBody,
     request: Request,
-    background_tasks: BackgroundTasks,
-    db: SessionDep,
-    redis: RedisDep,
+    db: ReadSessionDep,
+    redis: AsyncRedisDep,
 ):
     origin = request.headers.get("Origin", "")
     try:
         email = body.email
-        try:
-            _ = await get_user(db, email=email)
-            is_new_user = False
-        except Exception:
-            is_new_user = True
+        # A deactivated account still owns its email: it signs in (and is
+        # reactivated on verification) rather than signing up again
+        is_new_user = await get_user_status(db, email=email) is None
 
         token = create_login_token(email)
         verification_code = create_verification_code()
 
-        store_login_token(redis, token, verification_code)
+        await store_login_token(redis, token, verification_code)
 
-        background_tasks.add_task(
-            send_verification_email,
-            origin,
-            email,
-            verification_code,
-            token,
-            is_new_user,
+        # Sent by the job worker; the id makes a re-enqueued login a no-op
+        await send_verification_email.enqueue(
+            job_id=hashlib.sha256(token.encode()).hexdigest(),
+            origin=origin,
+            to_email=email,
+            code=verification_code,
+            token=token,
+            is_new_user=is_new_user,
         )
 
-        return {"login_token": token, "is_new_user": is_new_user}
+        return ORJSONResponse(LoginResponse(token, is_new_user))
 
     except HTTPException:
         raise
     except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
         logging.error(f"Failed to send verification email: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -144,27 +151,27 @@ class AttemptUsernameBody(BaseModel):
 
 @router.post(
     "/attempt/username",
+    response_model=UsernameAvailabilityResponse,
     responses={status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"}},
 )
 async def attempt_username(
     body: AttemptUsernameBody,
-    db: SessionDep,
+    db: ReadSessionDep,
 ):
     try:
         username = username_validator(body.username)
 
-        try:
-            _ = await get_user(db, username=username)
+        if await get_user_status(db, username=username) is not None:
             raise ValueError("Username is already taken")
-        except Exception:
-            pass
 
-        return {"available": True}
+        return ORJSONResponse(UsernameAvailabilityResponse(True))
 
     except ValueError as e:
-        return {"available": False, "error": str(e)}
+        return ORJSONResponse(UsernameAvailabilityResponse(False, str(e)))
 
     except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
         logging.error(f"Failed to check username availability: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -183,14 +190,14 @@ class VerifyRequestBody(BaseModel):
 
 @router.post(
     "/verify/email",
+    response_model=TokenResponse,
     responses={status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"}},
 )
 async def verify_with_email(
     body: VerifyRequestBody,
     request: Request,
-    response: Response,
     db: SessionDep,
-    redis: RedisDep,
+    redis: AsyncRedisDep,
 ):
     try:
         token = body.token
@@ -202,7 +209,9 @@ async def verify_with_email(
         if not email:
             raise Exception("Invalid or expired token")
 
-        saved_verification_code = get_verification_code_from_login_token(redis, token)
+        saved_verification_code = await get_verification_code_from_login_token(
+            redis, token
+        )
 
         if not saved_verification_code:
             raise Exception("Invalid or expired token")
@@ -218,15 +227,21 @@ async def verify_with_email(
                 raise Exception("Invalid new user data")
 
             user = await create_user(db, email, name, username, gender)
+            reactivated = False
         else:
-            user = await get_user(db, email=email)
+            reactivated = await reactivate_user(db, email)
+            user = await get_user_profile(db, email=email)
 
         user_id = str(user.id)
         access_token = create_access_token(user_id)
-        refresh_token = create_refresh_token()
+        refresh_token = create_refresh_token(user_id)
+
+        await store_refresh_token(redis, refresh_token, user_id, request)
+        await invalidate_login_token(redis, token)
 
-        store_refresh_token(redis, refresh_token, user_id, request)
-        invalidate_login_token(redis, token)
+        response = ORJSONResponse(TokenResponse(access_token))
+        if is_new_user or reactivated:
+            await mark_recent_write(user_id)
 
         # response.set_cookie(
         #     "access_token",
@@ -237,22 +252,13 @@ async def verify_with_email(
         #     expires=get_settings().access_token_expiry_minutes * 60,
         # )
 
-        response.set_cookie(
-            "refresh_token",
-            refresh_token,
-            httponly=True,
-            secure=True,
-            samesite="strict",
-            expires=get_settings().refresh_token_expiry_days * 24 * 60 * 60,
-        )
+        set_refresh_token_cookie(response, refresh_token)
 
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            # "refresh_token": refresh_token,
-        }
+        return response
 
     except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
         logging.error(f"Failed to verify login: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -262,28 +268,30 @@ async def verify_with_email(
 
 @router.post(
     "/refresh",
+    response_model=TokenResponse,
     responses={status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"}},
 )
 async def refresh_access_token(
     request: Request,
-    response: Response,
-    redis: RedisDep,
+    redis: AsyncRedisDep,
 ):
     try:
         refresh_token = request.cookies.get("refresh_token")
         if not refresh_token:
             raise Exception("Refresh token not found")
 
-        user_id = validate_refresh_token(redis, refresh_token)
+        user_id = await validate_refresh_token(redis, refresh_token)
 
         if not user_id:
             raise Exception("Invalid or expired refresh token")
 
         new_access_token = create_access_token(user_id)
-        new_refresh_token = create_refresh_token()
+        new_refresh_token = create_refresh_token(user_id)
+
+        await store_refresh_token(redis, new_refresh_token, user_id, request)
+        await invalidate_refresh_token(redis, refresh_token)
 
-        store_refresh_token(redis, new_refresh_token, user_id, request)
-        invalidate_refresh_token(redis, refresh_token)
+        response = ORJSONResponse(TokenResponse(new_access_token))
 
         # response.set_cookie(
         #     "access_token",
@@ -294,24 +302,15 @@ async def refresh_access_token(
         #     expires=get_settings().access_token_expiry_minutes * 60,
         # )
 
-        response.set_cookie(
-            "refresh_token",
-            new_refresh_token,
-            httponly=True,
-            secure=True,
-            samesite="strict",
-            expires=get_settings().refresh_token_expiry_days * 24 * 60 * 60,
-        )
+        set_refresh_token_cookie(response, new_refresh_token)
 
-        return {
-            "access_token": new_access_token,
-            "token_type": "bearer",
-            # "refresh_token": new_refresh_token,
-        }
+        return response
 
     except HTTPException:
         raise
     except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
         logging.error(f"Failed to refresh token: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -319,23 +318,25 @@ async def refresh_access_token(
         )
 
 
-@router.post("/logout")
+@router.post("/logout", response_model=MessageResponse)
 async def logout(
     request: Request,
-    response: Response,
-    redis: RedisDep,
+    redis: AsyncRedisDep,
 ):
     try:
         refresh_token = request.cookies.get("refresh_token")
 
         if refresh_token:
-            invalidate_refresh_token(redis, refresh_token)
+            await invalidate_refresh_token(redis, refresh_token)
 
+        response = ORJSONResponse(MessageResponse("Logged out"))
         response.delete_cookie("refresh_token")
 
-        return {"message": "Logged out"}
+        return response
 
     except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
         logging.error(f"Failed to log out: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -343,10 +344,22 @@ async def logout(
         )
 
 
-@router.get("/")
-async def read_auth(current_user: User = Depends(read_current_user)):
-    return {
-        "name": current_user.name,
-        "username": current_user.username,
-        "profile_picture": current_user.profile_picture,
-    }
+@router.get(
+    "/",
+    response_model=AuthUserResponse,
+    responses={status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified"}},
+)
+async def read_auth(
+    request: Request,
+    current_user: UserProfile = Depends(read_current_user),
+):
+    return cached_json_response(
+        request,
+        ("auth", current_user.id, current_user.updated_at),
+        current_user.updated_at,
+        lambda: AuthUserResponse(
+            current_user.name,
+            current_user.username,
+            current_user.profile_picture,
+        ),
+    )
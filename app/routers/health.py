@@ -0,0 +1,27 @@
+from fastapi import APIRouter, status
+from fastapi.responses import ORJSONResponse
+
+from app.resilience import breakers
+from app.warmup import warmup
+
+router = APIRouter(prefix="/health", tags=["health"], include_in_schema=False)
+
+
+@router.get("/live")
+async def read_liveness():
+    return ORJSONResponse({"status": "ok"})
+
+
+@router.get("/ready")
+async def read_readiness():
+    # Ready once warm-up has run. Open breakers are reported but do not
+    # fail readiness: degraded workers still serve
+    return ORJSONResponse(
+        {
+            "status": "ready" if warmup.ready else "not_ready",
+            "breakers": {breaker.name: breaker.state for breaker in breakers},
+        },
+        status_code=(
+            status.HTTP_200_OK if warmup.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+    )
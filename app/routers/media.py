@@ -0,0 +1,126 @@
+import logging
+from dataclasses import dataclass
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import update
+
+from app.config import get_settings
+from app.database import SessionDep, mark_recent_write
+from app.dependencies import read_current_user
+from app.internal.media import (
+    StoredMedia,
+    receive_files,
+    store_media,
+    store_profile_picture,
+)
+from app.internal.users import UserProfile
+from app.models import User
+from app.storage import get_storage
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+
+@dataclass(slots=True)
+class MediaResponse:
+    media: list[StoredMedia]
+
+
+@dataclass(slots=True)
+class ProfilePictureResponse:
+    profile_picture: str
+
+
+def multipart_body(max_files: int):
+    # The body is parsed by hand so it can be streamed; describe it for OpenAPI
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "files": {
+                                "type": "array",
+                                "items": {"type": "string", "format": "binary"},
+                                "maxItems": max_files,
+                            }
+                        },
+                    }
+                }
+            },
+        }
+    }
+
+
+@router.post(
+    "/",
+    response_model=MediaResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"},
+        status.HTTP_401_UNAUTHORIZED: {"description": "Unauthorized"},
+    },
+    openapi_extra=multipart_body(get_settings().media_max_files),
+)
+async def upload_media(
+    request: Request,
+    current_user: UserProfile = Depends(read_current_user),
+):
+    try:
+        storage = get_storage()
+        files = await receive_files(request, storage, get_settings().media_max_files)
+        try:
+            media = [await store_media(storage, file) for file in files]
+        except BaseException:
+            # store_media only discards the file it was given
+            for file in files:
+                file.discard()
+            raise
+        return ORJSONResponse(MediaResponse(media))
+
+    except Exception as e:
+        logging.error(f"Failed to upload media: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to upload media",
+        )
+
+
+@router.put(
+    "/profile-picture",
+    response_model=ProfilePictureResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"},
+        status.HTTP_401_UNAUTHORIZED: {"description": "Unauthorized"},
+    },
+    openapi_extra=multipart_body(1),
+)
+async def upload_profile_picture(
+    request: Request,
+    db: SessionDep,
+    current_user: UserProfile = Depends(read_current_user),
+):
+    try:
+        storage = get_storage()
+        (file,) = await receive_files(request, storage, 1)
+        profile_picture = await store_profile_picture(storage, file)
+
+        await db.execute(
+            update(User)
+            .where(User.id == current_user.id)
+            .values(profile_picture=profile_picture)
+        )
+        await db.commit()
+
+        response = ORJSONResponse(ProfilePictureResponse(profile_picture))
+        await mark_recent_write(str(current_user.id))
+        return response
+
+    except Exception as e:
+        await db.rollback()
+        logging.error(f"Failed to upload profile picture: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to upload profile picture",
+        )
@@ -0,0 +1,134 @@
+import asyncio
+from typing import Optional
+
+import jwt
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import StreamingResponse
+
+from app.config import get_settings
+from app.internal.realtime import Subscriber, hub
+from app.token import get_user_id_from_access_token
+
+router = APIRouter(prefix="/realtime", tags=["realtime"])
+
+
+def authenticate(authorization: Optional[str], token: Optional[str]):
+    # Browsers cannot set headers on WebSocket/EventSource, so the access
+    # token may also be passed as a query parameter
+    if authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        return None
+    try:
+        return get_user_id_from_access_token(token)
+    except jwt.InvalidTokenError:
+        return None
+
+
+async def wait_for_disconnect(websocket: WebSocket, subscriber: Subscriber):
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscriber.close("disconnect")
+
+
+@router.websocket("/ws")
+async def realtime_websocket(websocket: WebSocket, token: Optional[str] = None):
+    user_id = authenticate(websocket.headers.get("Authorization"), token)
+    if not user_id:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    subscriber = hub.subscribe(user_id)
+    if not subscriber:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    try:
+        await websocket.accept()
+    except BaseException:
+        # A client gone during the handshake must not keep its slot
+        hub.unsubscribe(subscriber)
+        raise
+    receiver = asyncio.create_task(wait_for_disconnect(websocket, subscriber))
+    try:
+        while (message := await subscriber.queue.get()) is not None:
+            await asyncio.wait_for(
+                websocket.send_text(message),
+                timeout=get_settings().realtime_send_timeout_seconds,
+            )
+    except (asyncio.TimeoutError, WebSocketDisconnect):
+        subscriber.close("slow_consumer")
+    finally:
+        hub.unsubscribe(subscriber)
+        receiver.cancel()
+
+    if subscriber.reason in ("slow_consumer", "shutdown"):
+        try:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        except RuntimeError:
+            pass
+
+
+@router.get(
+    "/events",
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"description": "Unauthorized"},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Service Unavailable"},
+    },
+)
+async def realtime_events(request: Request, token: Optional[str] = None):
+    user_id = authenticate(request.headers.get("Authorization"), token)
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if hub.full:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many connections",
+            headers={"Retry-After": "5"},
+        )
+
+    async def event_stream():
+        # Subscribed only once the stream runs: a client that disconnects
+        # before then never takes a connection slot
+        subscriber = hub.subscribe(user_id)
+        if not subscriber:
+            # Filled up since the check above; EventSource reconnects
+            yield b"retry: 5000\n\n"
+            return
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        subscriber.queue.get(),
+                        timeout=get_settings().realtime_keepalive_seconds,
+                    )
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield f"data: {message}\n\n".encode()
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
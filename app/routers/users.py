@@ -1,43 +1,418 @@
 import logging
+from dataclasses import dataclass
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse
 
-from app.database import SessionDep
-from app.dependencies import read_current_user
-from app.internal.users import get_user
-from app.models import User
+from app.cache import AsyncRedisDep
+from app.config import get_settings
+from app.database import (
+    ReadSessionDep,
+    SessionDep,
+    is_database_unavailable,
+    is_pinned_to_primary,
+    mark_recent_write,
+)
+from app.dependencies import is_backend_unavailable, read_current_user
+from app.http_cache import cached_json_response
+from app.internal.follows import (
+    FollowUser,
+    answer_follow_request,
+    follow_user,
+    has_follow,
+    is_following,
+    list_follow_requests,
+    list_follows,
+    request_follow,
+    unfollow_user,
+)
+from app.internal.realtime import publish_to_user
+from app.internal.users import UserProfile, get_user_profile, load_user_page
+from app.resilience import service_unavailable
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
+@dataclass(slots=True)
+class UserResponse:
+    name: str
+    username: str
+    profile_picture: Optional[str]
+    bio: Optional[str]
+    is_private: bool
+    is_self: bool
+    is_following: bool
+    posts_count: int
+    followers_count: int
+    following_count: int
+
+
+@dataclass(slots=True)
+class FollowResponse:
+    is_following: bool
+    # Private accounts approve followers; until then the follow is requested
+    is_requested: bool = False
+
+
+@dataclass(slots=True)
+class FollowListResponse:
+    users: list[FollowUser]
+    next_cursor: Optional[str]
+
+
 @router.get(
     "/{username}",
+    response_model=UserResponse,
     responses={
         status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"},
+        status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified"},
         status.HTTP_401_UNAUTHORIZED: {"description": "Unauthorized"},
         status.HTTP_404_NOT_FOUND: {"description": "Not Found"},
     },
 )
 async def read_user_with_username(
-    db: SessionDep,
+    request: Request,
+    db: ReadSessionDep,
+    redis: AsyncRedisDep,
     username: str,
-    current_user: User = Depends(read_current_user),
+    current_user: UserProfile = Depends(read_current_user),
 ):
     try:
-        user = await get_user(db, username=username)
+        user, counts = await load_user_page(
+            username, await is_pinned_to_primary(request)
+        )
+        is_self = user.id == current_user.id
+        try:
+            following = not is_self and await is_following(
+                db, redis, current_user.id, user.id
+            )
+        except Exception as e:
+            # Degraded: a stale page is still served, private details are not
+            if not is_database_unavailable(e):
+                raise
+            following = False
+        # Private profiles only show their details to followers
+        can_view = not user.is_private or is_self or following
 
-        return {
-            "name": user.name,
-            "username": user.username,
-            "profile_picture": user.profile_picture,
-            "bio": user.bio,
-            "is_private": user.is_private,
-            "is_self": user.id == current_user.id,
-            # "posts": user.posts,
-            # "replies": user.replies,
-        }
+        return cached_json_response(
+            request,
+            ("user", user.id, user.updated_at, counts, is_self, following),
+            max(user.updated_at, counts.updated_at or user.updated_at),
+            lambda: UserResponse(
+                user.name,
+                user.username,
+                user.profile_picture,
+                user.bio if can_view else None,
+                user.is_private,
+                is_self,
+                following,
+                counts.posts_count,
+                counts.followers_count,
+                counts.following_count,
+            ),
+        )
     except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
         logging.error(f"Failed to read user: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to read user"
         )
+
+
+@router.put(
+    "/{username}/follow",
+    response_model=FollowResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"},
+        status.HTTP_401_UNAUTHORIZED: {"description": "Unauthorized"},
+    },
+)
+async def follow(
+    db: SessionDep,
+    redis: AsyncRedisDep,
+    username: str,
+    current_user: UserProfile = Depends(read_current_user),
+):
+    try:
+        user = await get_user_profile(db, username=username)
+        if user.id == current_user.id:
+            raise ValueError("Cannot follow yourself")
+
+        if user.is_private and not await has_follow(db, current_user.id, user.id):
+            created = await request_follow(db, current_user.id, user.id)
+            event_type = "follow_request"
+            response = ORJSONResponse(FollowResponse(False, True))
+        else:
+            created = await follow_user(db, redis, current_user.id, user.id)
+            event_type = "follow"
+            response = ORJSONResponse(FollowResponse(True))
+
+        if created:
+            try:
+                await publish_to_user(
+                    str(user.id),
+                    {"type": event_type, "username": current_user.username},
+                )
+            except Exception as e:
+                logging.error(f"Failed to publish {event_type} event: {str(e)}")
+
+        await mark_recent_write(str(current_user.id))
+        return response
+
+    except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
+        logging.error(f"Failed to follow user: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to follow user"
+        )
+
+
+@router.delete(
+    "/{username}/follow",
+    response_model=FollowResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"},
+        status.HTTP_401_UNAUTHORIZED: {"description": "Unauthorized"},
+    },
+)
+async def unfollow(
+    db: SessionDep,
+    redis: AsyncRedisDep,
+    username: str,
+    current_user: UserProfile = Depends(read_current_user),
+):
+    try:
+        user = await get_user_profile(db, username=username)
+        await unfollow_user(db, redis, current_user.id, user.id)
+
+        response = ORJSONResponse(FollowResponse(False))
+        await mark_recent_write(str(current_user.id))
+        return response
+
+    except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
+        logging.error(f"Failed to unfollow user: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to unfollow user"
+        )
+
+
+async def read_follows(
+    db: ReadSessionDep,
+    redis: AsyncRedisDep,
+    username: str,
+    followers: bool,
+    cursor: Optional[str],
+    limit: int,
+    current_user: UserProfile,
+):
+    user = await get_user_profile(db, username=username)
+    if (
+        user.is_private
+        and user.id != current_user.id
+        and not await is_following(db, redis, current_user.id, user.id)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="This account is private"
+        )
+
+    users, next_cursor = await list_follows(db, user.id, followers, cursor, limit)
+    return ORJSONResponse(FollowListResponse(users, next_cursor))
+
+
+FOLLOW_LIST_RESPONSES = {
+    status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"},
+    status.HTTP_401_UNAUTHORIZED: {"description": "Unauthorized"},
+    status.HTTP_403_FORBIDDEN: {"description": "Forbidden"},
+}
+
+
+@router.get(
+    "/{username}/followers",
+    response_model=FollowListResponse,
+    responses=FOLLOW_LIST_RESPONSES,
+)
+async def read_followers(
+    db: ReadSessionDep,
+    redis: AsyncRedisDep,
+    username: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=get_settings().follow_page_size, ge=1, le=100),
+    current_user: UserProfile = Depends(read_current_user),
+):
+    try:
+        return await read_follows(
+            db, redis, username, True, cursor, limit, current_user
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
+        logging.error(f"Failed to read followers: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to read followers",
+        )
+
+
+@router.get(
+    "/{username}/following",
+    response_model=FollowListResponse,
+    responses=FOLLOW_LIST_RESPONSES,
+)
+async def read_following(
+    db: ReadSessionDep,
+    redis: AsyncRedisDep,
+    username: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=get_settings().follow_page_size, ge=1, le=100),
+    current_user: UserProfile = Depends(read_current_user),
+):
+    try:
+        return await read_follows(
+            db, redis, username, False, cursor, limit, current_user
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
+        logging.error(f"Failed to read following: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to read following",
+        )
+
+
+def verify_own_account(username: str, current_user: UserProfile):
+    if username != current_user.username:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the account owner can manage follow requests",
+        )
+
+
+@router.get(
+    "/{username}/follow-requests",
+    response_model=FollowListResponse,
+    responses=FOLLOW_LIST_RESPONSES,
+)
+async def read_follow_requests(
+    db: SessionDep,
+    username: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=get_settings().follow_page_size, ge=1, le=100),
+    current_user: UserProfile = Depends(read_current_user),
+):
+    verify_own_account(username, current_user)
+    try:
+        users, next_cursor = await list_follow_requests(
+            db, current_user.id, cursor, limit
+        )
+        return ORJSONResponse(FollowListResponse(users, next_cursor))
+    except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
+        logging.error(f"Failed to read follow requests: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to read follow requests",
+        )
+
+
+async def answer_request(
+    db: SessionDep,
+    redis: AsyncRedisDep,
+    username: str,
+    follower_username: str,
+    current_user: UserProfile,
+    approve: bool,
+):
+    verify_own_account(username, current_user)
+    follower = await get_user_profile(db, username=follower_username)
+    if not await answer_follow_request(
+        db, redis, follower.id, current_user.id, approve
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="No pending follow request"
+        )
+    if approve:
+        try:
+            await publish_to_user(
+                str(follower.id),
+                {"type": "follow_approved", "username": current_user.username},
+            )
+        except Exception as e:
+            logging.error(f"Failed to publish follow_approved event: {str(e)}")
+
+    await mark_recent_write(str(current_user.id))
+    return ORJSONResponse(FollowResponse(approve))
+
+
+FOLLOW_REQUEST_RESPONSES = {
+    status.HTTP_400_BAD_REQUEST: {"description": "Bad Request"},
+    status.HTTP_401_UNAUTHORIZED: {"description": "Unauthorized"},
+    status.HTTP_403_FORBIDDEN: {"description": "Forbidden"},
+    status.HTTP_404_NOT_FOUND: {"description": "Not Found"},
+}
+
+
+@router.put(
+    "/{username}/follow-requests/{follower_username}",
+    response_model=FollowResponse,
+    responses=FOLLOW_REQUEST_RESPONSES,
+)
+async def approve_follow_request(
+    db: SessionDep,
+    redis: AsyncRedisDep,
+    username: str,
+    follower_username: str,
+    current_user: UserProfile = Depends(read_current_user),
+):
+    try:
+        return await answer_request(
+            db, redis, username, follower_username, current_user, True
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
+        logging.error(f"Failed to approve follow request: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to approve follow request",
+        )
+
+
+@router.delete(
+    "/{username}/follow-requests/{follower_username}",
+    response_model=FollowResponse,
+    responses=FOLLOW_REQUEST_RESPONSES,
+)
+async def decline_follow_request(
+    db: SessionDep,
+    redis: AsyncRedisDep,
+    username: str,
+    follower_username: str,
+    current_user: UserProfile = Depends(read_current_user),
+):
+    try:
+        return await answer_request(
+            db, redis, username, follower_username, current_user, False
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        if is_backend_unavailable(e):
+            raise service_unavailable(e)
+        logging.error(f"Failed to decline follow request: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to decline follow request",
+        )
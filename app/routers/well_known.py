@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Response
+
+from app.config import get_settings
+from app.keys import get_keyring
+
+router = APIRouter(prefix="/.well-known", tags=["well-known"])
+
+
+@router.get("/jwks.json")
+async def read_jwks():
+    # Lets other services verify access tokens locally
+    return Response(
+        content=get_keyring().jwks,
+        media_type="application/json",
+        headers={
+            "Cache-Control": f"public, max-age={get_settings().jwks_max_age_seconds}"
+        },
+    )
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+import redis
+import redis.asyncio
+
+from app.cache import RedisCircuitOpenError, async_r
+from app.config import get_settings
+from app.metrics import Counter
+
+singleflight_calls = Counter(
+    "singleflight_calls_total",
+    "Coalesced lookups by group and outcome (leader, shared, remote)",
+)
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one in-flight task. The task
+    # is independent from its callers, so a cancelled caller (e.g. a client
+    # that disconnected) does not fail the others
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+
+    @property
+    def in_flight(self):
+        return len(self._tasks)
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]):
+        task = self._tasks.get(key)
+        if task is not None:
+            singleflight_calls.inc(group=self.name, result="shared")
+            return await asyncio.shield(task)
+
+        singleflight_calls.inc(group=self.name, result="leader")
+        task = asyncio.ensure_future(function())
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # Avoid "exception was never retrieved" when every caller is gone
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task)
+
+
+class SharedSingleFlight(SingleFlight):
+    # Adds cross-worker coalescing: the first worker to take a short Redis
+    # lock runs the lookup and publishes its result; other workers wait for
+    # it for up to the lock duration, then fall back to their own lookup
+
+    def __init__(
+        self,
+        name: str,
+        encode: Callable[[Any], bytes],
+        decode: Callable[[bytes], Any],
+        client: redis.asyncio.Redis = async_r,
+    ):
+        super().__init__(name)
+        self.encode = encode
+        self.decode = decode
+        self.client = client
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]):
+        if not get_settings().singleflight_redis_enabled:
+            return await super().do(key, function)
+        return await super().do(key, lambda: self._shared(key, function))
+
+    async def _shared(self, key: Hashable, function: Callable[[], Awaitable[Any]]):
+        settings = get_settings()
+        lock_key = f"singleflight:{self.name}:{key}"
+        result_key = f"{lock_key}:result"
+
+        try:
+            if not await self.client.set(
+                lock_key, 1, nx=True, px=settings.singleflight_redis_lock_ms
+            ):
+                result = await self._wait_for_result(
+                    result_key, settings.singleflight_redis_lock_ms
+                )
+                if result is not None:
+                    singleflight_calls.inc(group=self.name, result="remote")
+                    return self.decode(result)
+                return await function()
+        except (redis.RedisError, RedisCircuitOpenError) as e:
+            logging.error(f"Shared single-flight unavailable: {str(e)}")
+            return await function()
+
+        try:
+            value = await function()
+        except BaseException:
+            await self._unlock(lock_key)
+            raise
+
+        # The result is already in hand: a Redis failure from here on only
+        # costs the other workers their shared copy
+        try:
+            await self.client.set(
+                result_key,
+                self.encode(value),
+                px=settings.singleflight_redis_lock_ms,
+            )
+        except (redis.RedisError, RedisCircuitOpenError) as e:
+            logging.error(f"Failed to share single-flight result: {str(e)}")
+        await self._unlock(lock_key)
+        return value
+
+    async def _unlock(self, lock_key: str):
+        # Otherwise waiters fall back to their own lookup when it expires
+        try:
+            await self.client.delete(lock_key)
+        except (redis.RedisError, RedisCircuitOpenError) as e:
+            logging.error(f"Failed to release single-flight lock: {str(e)}")
+
+    async def _wait_for_result(self, result_key: str, timeout_ms: int):
+        deadline = asyncio.get_running_loop().time() + timeout_ms / 1000
+        delay = 0.005
+        while True:
+            result: Optional[bytes] = await self.client.get(result_key)
+            if result is not None:
+                return result
+            if asyncio.get_running_loop().time() + delay > deadline:
+                return None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
@@ -0,0 +1,69 @@
+import os
+import uuid
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+import anyio
+import anyio.to_thread
+
+from app.config import get_settings
+
+
+class Storage(ABC):
+    # Uploads are always spooled to a local temporary file first, so a
+    # backend only has to know how to take ownership of a finished file
+
+    @abstractmethod
+    def temp_path(self) -> str: ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    async def put(self, key: str, path: str): ...
+
+    @abstractmethod
+    def url(self, key: str) -> str: ...
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        # Temporary files live under the same root so `put` is an atomic rename
+        os.makedirs(os.path.join(self.root, ".tmp"), exist_ok=True)
+
+    def temp_path(self):
+        return os.path.join(self.root, ".tmp", uuid.uuid4().hex)
+
+    def path(self, key: str):
+        return os.path.join(self.root, key[:2], key)
+
+    async def exists(self, key: str):
+        return await anyio.Path(self.path(key)).exists()
+
+    async def put(self, key: str, path: str):
+        destination = self.path(key)
+
+        def move():
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(path, destination)
+
+        await anyio.to_thread.run_sync(move)
+
+    def url(self, key: str):
+        return f"{self.base_url}/{key[:2]}/{key}"
+
+
+STORAGE_BACKENDS = {
+    "local": LocalStorage,
+}
+
+
+@lru_cache
+def get_storage() -> Storage:
+    settings = get_settings()
+    backend = STORAGE_BACKENDS.get(settings.media_storage_backend)
+    if not backend:
+        raise ValueError(f"Unknown storage backend: {settings.media_storage_backend}")
+    return backend(settings.media_storage_root, settings.media_base_url)
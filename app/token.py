@@ -3,13 +3,21 @@ import secrets
 import string
 import uuid
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 import jwt
-import redis
+import redis.asyncio
 from fastapi import Request
 from fastapi.encoders import jsonable_encoder
 
+from app.cache import async_r
 from app.config import get_settings
+from app.keys import get_keyring
+
+
+def as_str(value):
+    # Replies are bytes or str depending on the client's decode_responses
+    return value.decode() if isinstance(value, bytes) else value
 
 
 # Login token
@@ -41,17 +49,19 @@ def create_verification_code():
     return "-".join(word_parts)
 
 
-def store_login_token(redis: redis.Redis, token: str, code: str):
-    redis.set(
+async def store_login_token(redis: redis.asyncio.Redis, token: str, code: str):
+    await redis.set(
         f"login_token:{token}",
         code,
         ex=get_settings().verification_email_expiry_minutes * 60,
     )
 
 
-def get_verification_code_from_login_token(redis: redis.Redis, token: str):
-    code = str(redis.get(f"login_token:{token}"))
-    return code if code else None
+async def get_verification_code_from_login_token(
+    redis: redis.asyncio.Redis, token: str
+):
+    code = await redis.get(f"login_token:{token}")
+    return as_str(code) if code else None
 
 
 def get_email_from_login_token(token: str):
@@ -60,8 +70,8 @@ def get_email_from_login_token(token: str):
     return email if email else None
 
 
-def invalidate_login_token(redis: redis.Redis, token: str):
-    redis.delete(f"login_token:{token}")
+async def invalidate_login_token(redis: redis.asyncio.Redis, token: str):
+    await redis.delete(f"login_token:{token}")
 
 
 # Access token
@@ -87,13 +97,82 @@ def get_user_id_from_access_token(token: str):
 
 
 # Refresh token
-def create_refresh_token():
-    token = str(uuid.uuid4())
+#
+# Keys are hash-tagged by user ({user_id}), so a token and its user's
+# session set map to one slot and are written by one script, also on Redis
+# Cluster. Tokens are "<user_id>.<random>" so the tag is known from the
+# cookie alone. Tokens issued before carry no user: `python -m app.cli
+# migrate-token-keys` moves them to the tagged layout and records their
+# owner, and until then they are still read from the legacy keys
+
+# KEYS: token, sessions. ARGV: token data, TTL, token
+STORE_REFRESH_TOKEN = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('SADD', KEYS[2], ARGV[3])
+"""
+
+# KEYS: token[, sessions]. ARGV: token. The token keeps its TTL, so it
+# reads as expired rather than unknown until then. Returns the owner
+INVALIDATE_REFRESH_TOKEN = """
+local data = redis.call('GET', KEYS[1])
+if not data then
+    return false
+end
+local token_data = cjson.decode(data)
+token_data['is_active'] = false
+redis.call('SET', KEYS[1], cjson.encode(token_data), 'KEEPTTL')
+if KEYS[2] then
+    redis.call('SREM', KEYS[2], ARGV[1])
+end
+return token_data['user_id']
+"""
+
+# Registered once; requests run them on the client they were given
+store_refresh_token_script = async_r.register_script(STORE_REFRESH_TOKEN)
+invalidate_refresh_token_script = async_r.register_script(INVALIDATE_REFRESH_TOKEN)
+
+
+def refresh_token_key(user_id: str, token: str):
+    return f"refresh_token:{{{user_id}}}:{token}"
+
+
+def user_sessions_key(user_id: str):
+    return f"user_sessions:{{{user_id}}}"
+
+
+def refresh_token_owner_key(token: str):
+    return f"refresh_token_owner:{token}"
+
+
+def legacy_refresh_token_key(token: str):
+    return f"refresh_token:{token}"
+
+
+def legacy_user_sessions_key(user_id: str):
+    return f"user_sessions:{user_id}"
+
+
+def create_refresh_token(user_id: str):
+    token = f"{user_id}.{uuid.uuid4()}"
     return token
 
 
-def store_refresh_token(
-    redis: redis.Redis,
+async def resolve_refresh_token(
+    redis: redis.asyncio.Redis, token: str
+) -> tuple[str, Optional[str]]:
+    # Token key and session set key; legacy tokens that were not migrated
+    # yet have their session set in another slot
+    user_id, dot, _ = token.partition(".")
+    if not dot:
+        owner = await redis.get(refresh_token_owner_key(token))
+        if owner is None:
+            return legacy_refresh_token_key(token), None
+        user_id = as_str(owner)
+    return refresh_token_key(user_id, token), user_sessions_key(user_id)
+
+
+async def store_refresh_token(
+    redis: redis.asyncio.Redis,
     token: str,
     user_id: str,
     # client_id: str,
@@ -123,22 +202,25 @@ def store_refresh_token(
         "is_active": True,
     }
 
-    redis.set(
-        f"refresh_token:{token}",
-        json.dumps(jsonable_encoder(token_data)),
-        ex=get_settings().refresh_token_expiry_days * 24 * 60 * 60,
+    await store_refresh_token_script(
+        keys=[refresh_token_key(user_id, token), user_sessions_key(user_id)],
+        args=[
+            json.dumps(jsonable_encoder(token_data)),
+            get_settings().refresh_token_expiry_days * 24 * 60 * 60,
+            token,
+        ],
+        client=redis,
     )
 
-    redis.sadd(f"user_sessions:{user_id}", token)
-
 
-def get_token_data_from_refresh_token(redis: redis.Redis, token: str):
-    token_data_str = redis.get(f"refresh_token:{token}")
-    return json.loads(str(token_data_str)) if token_data_str else None
+async def get_token_data_from_refresh_token(redis: redis.asyncio.Redis, token: str):
+    key, _ = await resolve_refresh_token(redis, token)
+    token_data_str = await redis.get(key)
+    return json.loads(token_data_str) if token_data_str else None
 
 
-def validate_refresh_token(redis: redis.Redis, token: str):
-    token_data = get_token_data_from_refresh_token(redis, token)
+async def validate_refresh_token(redis: redis.asyncio.Redis, token: str):
+    token_data = await get_token_data_from_refresh_token(redis, token)
 
     if not token_data:
         raise ValueError("Invalid token")
@@ -155,36 +237,77 @@ def validate_refresh_token(redis: redis.Redis, token: str):
     return token_data["user_id"]
 
 
-def invalidate_refresh_token(redis: redis.Redis, token: str):
-    token_data = get_token_data_from_refresh_token(redis, token)
-    if not token_data:
+async def invalidate_refresh_token(redis: redis.asyncio.Redis, token: str):
+    key, sessions_key = await resolve_refresh_token(redis, token)
+    user_id = await invalidate_refresh_token_script(
+        keys=[key, sessions_key] if sessions_key else [key],
+        args=[token],
+        client=redis,
+    )
+    if user_id is None:
         raise ValueError("Invalid token")
 
-    token_data["is_active"] = False
-    redis.set(
-        f"refresh_token:{token}",
-        json.dumps(jsonable_encoder(token_data)),
-        ex=(
-            datetime.strptime(token_data["exp"], "%Y-%m-%dT%H:%M:%S.%f%z")
-            - datetime.now(timezone.utc)
-        ).seconds,
-    )
-    redis.srem(f"user_sessions:{token_data['user_id']}", token)
+    if not sessions_key:
+        await redis.srem(legacy_user_sessions_key(as_str(user_id)), token)
+
+
+async def migrate_refresh_tokens(redis: redis.asyncio.Redis):
+    # Moves legacy refresh tokens to the tagged layout while the app keeps
+    # serving. Tokens and their owner cannot share a slot with the legacy
+    # key, so the legacy value is taken last and wins if a request changed
+    # it meanwhile. Returns the number of tokens moved
+    migrated = 0
+    async for legacy_key in redis.scan_iter(match="refresh_token:*", count=1000):
+        legacy_key = as_str(legacy_key)
+        if "{" in legacy_key:
+            continue
+        token = legacy_key.removeprefix("refresh_token:")
+        token_data_str = await redis.get(legacy_key)
+        ttl = await redis.pttl(legacy_key)
+        if not token_data_str or ttl <= 0:
+            continue
+
+        user_id = json.loads(token_data_str)["user_id"]
+        key = refresh_token_key(user_id, token)
+        await redis.set(key, token_data_str, px=ttl)
+        await redis.set(refresh_token_owner_key(token), user_id, px=ttl)
+
+        final_token_data_str = await redis.getdel(legacy_key)
+        if final_token_data_str and final_token_data_str != token_data_str:
+            token_data_str = final_token_data_str
+            await redis.set(key, token_data_str, keepttl=True)
+        if json.loads(token_data_str)["is_active"]:
+            await redis.sadd(user_sessions_key(user_id), token)
+        migrated += 1
+
+    # Active members were re-added to the tagged sets above
+    async for legacy_key in redis.scan_iter(match="user_sessions:*", count=1000):
+        if "{" not in as_str(legacy_key):
+            await redis.delete(legacy_key)
+
+    return migrated
 
 
 def encode_jwt(payload: dict):
+    keyring = get_keyring()
     token = jwt.encode(
         payload,
-        get_settings().jwt_secret_key,
-        algorithm=get_settings().jwt_algorithm,
+        keyring.signing_key,
+        algorithm=keyring.algorithm,
+        headers={"kid": keyring.kid} if keyring.kid else None,
     )
     return token
 
 
 def decode_jwt(token: str):
+    kid = jwt.get_unverified_header(token).get("kid")
+    verification_key = get_keyring().verification_keys.get(kid)
+    if not verification_key:
+        raise jwt.InvalidTokenError("Unknown signing key")
+
     payload = jwt.decode(
         token,
-        get_settings().jwt_secret_key,
-        algorithms=[get_settings().jwt_algorithm],
+        verification_key.key,
+        algorithms=[verification_key.algorithm],
     )
     return payload
@@ -2,14 +2,35 @@ import re
 
 from pydantic import EmailStr, validate_email
 
+# Compiled once at import; these run per row during bulk imports
+BLACKLISTED_DOMAINS = frozenset(["example.com"])
+
+USERNAME_REGEX = re.compile(r"^[a-zA-Z0-9_]+$")
+
+BLACKLISTED_USERNAMES = frozenset(
+    [
+        "api",
+        "login",
+        "for-you",
+        "following",
+        "liked",
+        "saved",
+        "search",
+        "activity",
+        "notifications",
+        "messages",
+        "accounts",
+        "settings",
+        "insights",
+    ]
+)
+
 
 def email_validator(email: EmailStr):
     lowercase_email = email.lower()
     _, normalized_email = validate_email(lowercase_email)
     domain = normalized_email.split("@")[1]
 
-    BLACKLISTED_DOMAINS = ["example.com"]
-
     if domain in BLACKLISTED_DOMAINS:
         raise ValueError("Email domain not allowed")
 
@@ -22,26 +43,8 @@ def username_validator(username: str):
     if len(lowercase_username) < 3 or len(lowercase_username) > 30:
         raise ValueError("Username must be between 3 and 30 characters")
 
-    regex = r"^[a-zA-Z0-9_]+$"
-
-    BLACKLISTED_USERNAMES = [
-        "api",
-        "login",
-        "for-you",
-        "following",
-        "liked",
-        "saved",
-        "search",
-        "activity",
-        "notifications",
-        "messages",
-        "accounts",
-        "settings",
-        "insights",
-    ]
-
     # Check if username contains only letters, numbers, and underscores
-    if not re.match(regex, lowercase_username):
+    if not USERNAME_REGEX.match(lowercase_username):
         raise ValueError("Username must contain only letters, numbers, and underscores")
 
     # Check if username contains at least one letter
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.cache import async_r, r
+from app.config import get_settings
+from app.database import engine, replicas
+from app.internal.users import user_page_query, user_profile_query
+from app.keys import get_keyring
+from app.token import create_access_token, decode_jwt
+
+# Runs in the lifespan before a worker serves traffic, so the first
+# requests after a deploy do not pay for connecting to pgbouncer and Redis,
+# compiling the hot statements or parsing JWT keys. Steps run in task
+# groups, so one failing step cancels the rest instead of leaving them
+# holding connections while the worker serves
+
+
+def hot_queries():
+    # Never match a row; executing them compiles and prepares the statements
+    return (
+        user_profile_query(id=uuid.UUID(int=0)),
+        user_profile_query(email=""),
+        user_profile_query(username=""),
+        user_page_query(""),
+    )
+
+
+async def warm_database(engine: AsyncEngine, connections: int):
+    # Connections are held concurrently so the pool really opens that many;
+    # each one prepares the statements for itself
+    async def warm_connection():
+        async with engine.connect() as connection:
+            for query in hot_queries():
+                await connection.execute(query)
+
+    async with asyncio.TaskGroup() as group:
+        for _ in range(connections):
+            group.create_task(warm_connection())
+
+
+def warm_sync_redis(connections: int):
+    pool = getattr(r, "connection_pool", None)
+    if pool is None:
+        # Cluster clients keep a pool per node, opened as slots are used
+        r.ping()
+        return
+    opened = []
+    try:
+        for _ in range(connections):
+            # redis-py 5.2 requires the command name (later versions ignore it)
+            connection = pool.get_connection("PING")
+            opened.append(connection)
+            connection.send_command("PING")
+            connection.read_response()
+    finally:
+        for connection in opened:
+            pool.release(connection)
+
+
+async def warm_redis(connections: int):
+    async with asyncio.TaskGroup() as group:
+        for _ in range(connections):
+            group.create_task(async_r.ping())
+    await asyncio.to_thread(warm_sync_redis, connections)
+
+
+def warm_jwt():
+    get_keyring()
+    decode_jwt(create_access_token(str(uuid.UUID(int=0))))
+
+
+class WarmUp:
+    def __init__(self):
+        self.ready = False
+
+    async def run(self):
+        settings = get_settings()
+        if not settings.warmup_enabled:
+            self.ready = True
+            return
+
+        started = time.perf_counter()
+        try:
+            warm_jwt()
+            async with asyncio.timeout(settings.warmup_timeout_seconds):
+                async with asyncio.TaskGroup() as group:
+                    group.create_task(
+                        warm_database(engine, settings.warmup_db_connections)
+                    )
+                    for replica in replicas.replicas:
+                        group.create_task(
+                            warm_database(
+                                replica.engine, settings.warmup_db_connections
+                            )
+                        )
+                    group.create_task(warm_redis(settings.warmup_redis_connections))
+            logging.info(f"Warm-up done in {time.perf_counter() - started:.3f}s")
+        except Exception as e:
+            # A worker that cannot warm up still serves, degraded or not
+            logging.error(f"Warm-up incomplete: {e!r}")
+        self.ready = True
+
+
+warmup = WarmUp()
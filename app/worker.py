@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+import logging
+import signal
+
+import app.internal.emails  # noqa: F401 (registers jobs)
+from app.cache import async_client_class
+from app.config import get_settings
+from app.jobs import JobWorker
+
+# Usage:
+#   python -m app.worker               # every queue in JOB_QUEUES
+#   python -m app.worker email         # only the listed queues
+
+
+async def main():
+    parser = argparse.ArgumentParser(prog="python -m app.worker")
+    parser.add_argument("queues", nargs="*")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    queues = {
+        queue: concurrency
+        for queue, concurrency in settings.job_queues.items()
+        if not args.queues or queue in args.queues
+    }
+    if not queues:
+        parser.error(f"No such queues, configured: {list(settings.job_queues)}")
+
+    # Blocking reads need a deadline longer than the block time
+    client = async_client_class().from_url(
+        settings.redis_url,
+        decode_responses=True,
+        socket_timeout=settings.job_block_ms / 1000
+        + settings.redis_socket_timeout_seconds,
+        socket_connect_timeout=settings.redis_connect_timeout_seconds,
+    )
+    worker = JobWorker(client, queues)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+# Compares the ORM read path with the Core projection read path used by
+# the profile endpoints. Runs against an in-memory SQLite database, since
+# the overhead being measured (row -> object mapping) is client-side.
+#
+#   python -m benchmarks.read_path
+
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.internal.users import UserProfile, user_profile_query
+from app.models import User
+
+ITERATIONS = 20_000
+
+
+def orm_read(session: Session, username: str):
+    user = session.execute(select(User).where(User.username == username)).scalar_one()
+    payload = {
+        "name": user.name,
+        "username": user.username,
+        "profile_picture": user.profile_picture,
+        "bio": user.bio,
+        "is_private": user.is_private,
+    }
+    # Same lifecycle as a request scoped session
+    session.expunge_all()
+    return payload
+
+
+def core_read(session: Session, username: str):
+    row = session.connection().execute(user_profile_query(username=username)).first()
+    user = UserProfile(*row)
+    return {
+        "name": user.name,
+        "username": user.username,
+        "profile_picture": user.profile_picture,
+        "bio": user.bio,
+        "is_private": user.is_private,
+    }
+
+
+def measure(name: str, read, session: Session, username: str):
+    for _ in range(1_000):
+        read(session, username)
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        read(session, username)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    read(session, username)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<6} {elapsed / ITERATIONS * 1e6:8.1f} us/read  {peak:8d} B peak/read")
+
+
+def main():
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+
+    with Session(engine) as session:
+        session.execute(
+            insert(User),
+            [
+                {
+                    "email": f"user{i}@connector.rocks",
+                    "username": f"user_{i}",
+                    "name": f"User {i}",
+                }
+                for i in range(1_000)
+            ],
+        )
+        session.commit()
+
+        measure("orm", orm_read, session, "user_500")
+        measure("core", core_read, session, "user_500")
+
+
+if __name__ == "__main__":
+    main()
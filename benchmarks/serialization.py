@@ -0,0 +1,67 @@
+# Compares per-response serialization cost for each endpoint payload:
+#
+#   encoder   dict -> jsonable_encoder -> orjson (handlers returning dicts)
+#   validated dict -> response_model validation -> pydantic-core JSON
+#   direct    slotted dataclass -> orjson (ORJSONResponse, current path)
+#
+#   python -m benchmarks.serialization
+
+import dataclasses
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.routers.auth import AuthUserResponse, LoginResponse, TokenResponse
+from app.routers.users import UserResponse
+
+ITERATIONS = 100_000
+
+PAYLOADS = {
+    "GET /auth/": AuthUserResponse("Connector", "connector", None),
+    "GET /users/{username}": UserResponse(
+        "Connector",
+        "connector",
+        "/media/files/ab/abcdef.webp",
+        "Hello from Connector",
+        False,
+        True,
+        False,
+        42,
+        1280,
+        310,
+    ),
+    "POST /auth/login/email": LoginResponse("eyJhbGciOiJIUzI1NiJ9." * 6, True),
+    "POST /auth/verify/email": TokenResponse("eyJhbGciOiJIUzI1NiJ9." * 6),
+}
+
+
+def timed(function):
+    for _ in range(1_000):
+        function()
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        function()
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def main():
+    for endpoint, payload in PAYLOADS.items():
+        as_dict = dataclasses.asdict(payload)
+        adapter = TypeAdapter(type(payload))
+
+        encoder = timed(lambda: orjson.dumps(jsonable_encoder(as_dict)))
+        validated = timed(lambda: adapter.dump_json(adapter.validate_python(as_dict)))
+        direct = timed(lambda: orjson.dumps(payload))
+
+        print(
+            f"{endpoint:<26} encoder {encoder:6.2f} us"
+            f"  validated {validated:6.2f} us"
+            f"  direct {direct:6.2f} us"
+            f"  ({encoder / direct:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()